@@ -4,8 +4,11 @@ import base64
 import hashlib
 import datetime
 
+from django.conf import settings
 from user_agents import parse
 
+from pinecast.lru import LRUCache
+
 
 bot_browsers = (
     'Apache-HttpClient',
@@ -23,13 +26,24 @@ linux_oss = (
     'Ubuntu',
 )
 
-def get_device_type(req=None, ua=None):
-    if req and not hasattr(req, '__is_fake__'):
-        # TODO: clean this up
-        ua = req.META.get('HTTP_USER_AGENT', 'Unknown')
-        parsed = _parse_req(req)
-    else:
-        parsed = parse(ua or 'Unknown')
+# There are only a few thousand distinct user agents in our traffic, and
+# parsing one is expensive, so the results are kept per user agent string.
+_ua_cache = LRUCache(settings.UA_CACHE_SIZE)
+
+def classify_ua(ua):
+    """Returns a `(browser, device, os, is_bot)` tuple for the user agent."""
+    ua = ua or 'Unknown'
+    result = _ua_cache.get(ua)
+    if result is None:
+        result = _classify_ua(ua)
+        _ua_cache.set(ua, result)
+    return result
+
+def get_ua_cache_stats():
+    return _ua_cache.get_stats()
+
+def _classify_ua(ua):
+    parsed = parse(ua)
 
     settled = {
         'browser': parsed.browser.family,
@@ -68,19 +82,20 @@ def get_device_type(req=None, ua=None):
     elif any(x in settled['os'] for x in linux_oss):
         settled['os'] = 'Linux'
 
-    return settled['browser'], settled['device'], settled['os']
+    return settled['browser'], settled['device'], settled['os'], parsed.is_bot
 
 
-def is_bot(req=None, ua=None):
-    if not req and not ua: return False
-    return (_parse_req(req) if req else parse(ua)).is_bot
+def get_device_type(req=None, ua=None):
+    if req and not hasattr(req, '__is_fake__'):
+        ua = req.META.get('HTTP_USER_AGENT')
+    return classify_ua(ua)[:3]
 
 
-def _parse_req(req):
-    if not hasattr(req, '__parsed_ua'):
-        ua = req.META.get('HTTP_USER_AGENT', 'Unknown') or 'Unknown'
-        setattr(req, '__parsed_ua', parse(ua))
-    return getattr(req, '__parsed_ua')
+def is_bot(req=None, ua=None):
+    if not req and not ua: return False
+    if req:
+        ua = req.META.get('HTTP_USER_AGENT')
+    return classify_ua(ua)[3]
 
 
 def get_request_ip(req):
@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+
+
+class WindowedDeduplicator(object):
+    """
+    Remembers keys for at least `window` seconds, in at most `maxsize`
+    entries. Keys are kept in two generations: new keys go into the current
+    one, and once it is `window` seconds old (or holds half of `maxsize`
+    keys), it replaces the previous one, which is forgotten.
+
+    Keys are hex digests; only their first 64 bits are kept, which is
+    plenty to tell them apart and much smaller than the strings.
+    """
+
+    def __init__(self, window, maxsize):
+        self.window = window
+        self.maxsize = maxsize
+        self.seen = 0
+        self.dropped = 0
+        self.early_rotations = 0
+        self._current = set()
+        self._previous = set()
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _compact(self, key):
+        return int(key[:16], 16)
+
+    def _maybe_rotate(self):
+        now = time.monotonic()
+        expired = now - self._rotated_at >= self.window
+        if not expired and len(self._current) < self.maxsize // 2:
+            return
+        if not expired:
+            # Memory wins over the window: duplicates that arrive further
+            # apart than this may get through
+            self.early_rotations += 1
+        self._previous = self._current
+        self._current = set()
+        self._rotated_at = now
+
+    def filter(self, keys):
+        """
+        Returns the indices of the keys that haven't been seen, dropping
+        repeats within `keys` too. The keys aren't remembered until they are
+        passed to `record`, so that a batch that fails to write isn't dropped
+        when it is retried.
+        """
+        fresh = []
+        batch = set()
+        with self._lock:
+            self._maybe_rotate()
+            for i, key in enumerate(keys):
+                compact = self._compact(key)
+                self.seen += 1
+                if compact in batch or compact in self._current or compact in self._previous:
+                    self.dropped += 1
+                    continue
+                batch.add(compact)
+                fresh.append(i)
+        return fresh
+
+    def record(self, keys):
+        with self._lock:
+            self._maybe_rotate()
+            self._current.update(self._compact(k) for k in keys)
+
+    def clear(self):
+        with self._lock:
+            self._current = set()
+            self._previous = set()
+            self.seen = 0
+            self.dropped = 0
+            self.early_rotations = 0
+
+    def get_stats(self):
+        return {
+            'size': len(self._current) + len(self._previous),
+            'maxsize': self.maxsize,
+            'seen': self.seen,
+            'dropped': self.dropped,
+            'early_rotations': self.early_rotations,
+        }
+
+
+# CDN logs are sometimes delivered twice, and posts to /services/log are
+# retried, so the same listen can be ingested more than once. Listens are
+# identified by their `l_id` (which covers the IP, user agent, and time) along
+# with the episode and source, since one client can download several episodes
+# in the same second. Each process remembers the ones it has written; with
+# LOG_SPOOL on, a podcast's listens all go through the same partition worker,
+# so its duplicates are always caught.
+_listens = WindowedDeduplicator(settings.LISTEN_DEDUP_WINDOW, settings.LISTEN_DEDUP_SIZE)
+
+def filter_listens(listen_objs):
+    """Returns the listens that haven't already been written."""
+    if not settings.LISTEN_DEDUP_WINDOW:
+        return listen_objs
+    return [listen_objs[i] for i in _listens.filter([get_listen_id(lo) for lo in listen_objs])]
+
+def record_listens(listen_objs):
+    if not settings.LISTEN_DEDUP_WINDOW:
+        return
+    _listens.record([get_listen_id(lo) for lo in listen_objs])
+
+def get_listen_id(listen_obj):
+    _, points = listen_obj
+    listen = points[0]
+    return hashlib.sha1(','.join([
+        listen.fields['l_id'],
+        listen.tags['episode'],
+        listen.tags.get('source') or '',
+    ]).encode('utf-8')).hexdigest()
+
+def get_listen_dedup_stats():
+    return _listens.get_stats()
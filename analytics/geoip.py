@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+
+import csv
+import ipaddress
+import mmap
+import os
+import struct
+import threading
+
+import requests
+import rollbar
+from django.conf import settings
+
+
+# The embedded database is a single file:
+#
+#   header:    MAGIC, range count, location count
+#   ranges:    (start IP, end IP, location index), sorted by start IP. IPs are
+#              16 bytes, big endian, with IPv4 addresses mapped into IPv6, so
+#              comparing the raw bytes compares the addresses.
+#   locations: (offset, length) into the string table, per location
+#   strings:   each location as tab-separated code, city, lat, lon, and zip
+#
+# Every worker maps the same file read-only, so the pages are shared rather
+# than each process loading its own copy, and a lookup is a binary search over
+# fixed-size records.
+
+MAGIC = b'PCGEOIP1'
+HEADER = struct.Struct('>8sII')
+RANGE = struct.Struct('>16s16sI')
+LOCATION = struct.Struct('>IH')
+FIELDS = ('code', 'city', 'lat', 'lon', 'zip')
+
+
+def _pack_ip(ip):
+    addr = ipaddress.ip_address(ip)
+    if addr.version == 4:
+        addr = ipaddress.IPv6Address('::ffff:%s' % addr)
+    return addr.packed
+
+
+class RemoteGeoIPProvider(object):
+    def lookup_bulk(self, ips):
+        try:
+            res = requests.post('https://geoip.service.pinecast.com:444/bulk', json=ips, timeout=4)
+            return res.json()
+        except Exception as e:
+            rollbar.report_message(
+                '[pinecast geoip] Error resolving country for %d IPs (%s): %s' % (
+                    len(ips), ', '.join(ips[:5]), str(e)),
+                'error')
+            return None
+
+
+class EmbeddedGeoIPProvider(object):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.range_count, self.location_count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a GeoIP database' % path)
+        self.ranges_offset = HEADER.size
+        self.locations_offset = self.ranges_offset + self.range_count * RANGE.size
+        self.strings_offset = self.locations_offset + self.location_count * LOCATION.size
+
+    def _start(self, i):
+        offset = self.ranges_offset + i * RANGE.size
+        return self.data[offset:offset + 16]
+
+    def lookup(self, ip):
+        try:
+            packed = _pack_ip(ip)
+        except ValueError:
+            return None
+
+        # Find the last range that starts at or before the IP
+        lo, hi = 0, self.range_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._start(mid) <= packed:
+                lo = mid + 1
+            else:
+                hi = mid
+        if not lo:
+            return None
+
+        _, end, location = RANGE.unpack_from(self.data, self.ranges_offset + (lo - 1) * RANGE.size)
+        if packed > end:
+            return None
+
+        offset, length = LOCATION.unpack_from(
+            self.data, self.locations_offset + location * LOCATION.size)
+        start = self.strings_offset + offset
+        return dict(zip(FIELDS, self.data[start:start + length].decode('utf-8').split('\t')))
+
+    def lookup_bulk(self, ips):
+        return [self.lookup(ip) for ip in ips]
+
+
+def build_database(source, dest):
+    """
+    Builds an embedded database from a CSV file with a header row. Each row is
+    an IP range, given either as `network` (in CIDR notation) or as `start`
+    and `end` IPs, along with `code`, `city`, `lat`, `lon`, and `zip`. Returns
+    the number of ranges written.
+    """
+    ranges = []
+    locations = {}
+    for row in csv.DictReader(source):
+        if row.get('network'):
+            network = ipaddress.ip_network(row['network'], strict=False)
+            start, end = str(network[0]), str(network[-1])
+        else:
+            start, end = row['start'], row['end']
+        location = '\t'.join((row.get(f) or '').replace('\t', ' ') for f in FIELDS)
+        ranges.append((_pack_ip(start), _pack_ip(end), locations.setdefault(location, len(locations))))
+    ranges.sort()
+
+    strings = []
+    string_offset = 0
+    location_table = []
+    for location in sorted(locations, key=locations.get):
+        encoded = location.encode('utf-8')
+        location_table.append(LOCATION.pack(string_offset, len(encoded)))
+        strings.append(encoded)
+        string_offset += len(encoded)
+
+    # Written next to the destination and moved into place, so workers never
+    # map a partially written file
+    tmp = '%s.tmp' % dest
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(ranges), len(location_table)))
+        for r in ranges:
+            f.write(RANGE.pack(*r))
+        f.write(b''.join(location_table))
+        f.write(b''.join(strings))
+    os.rename(tmp, dest)
+
+    return len(ranges)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if settings.GEOIP_PROVIDER == 'embedded':
+                    _provider = EmbeddedGeoIPProvider(settings.GEOIP_DB_PATH)
+                else:
+                    _provider = RemoteGeoIPProvider()
+    return _provider
@@ -1,20 +1,54 @@
 from __future__ import absolute_import
 
+import os
+import threading
+
 from django.conf import settings
 from influxdb import InfluxDBClient
+from requests import Session
+from requests.adapters import HTTPAdapter
 
 from pinecast.types import StringTypes
 
 
-def get_client():
-    return InfluxDBClient(
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session_pid != pid:
+        with _session_lock:
+            # Connections can't be shared with the process we forked from
+            if _session_pid != pid:
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.INFLUXDB_POOL_SIZE)
+                session = Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+def get_client(timeout=None):
+    """
+    Returns an InfluxDB client. Clients are cheap to create, and they all share
+    one pool of keep-alive connections per process, so queries and writes
+    don't each pay for a new connection and TLS handshake.
+    """
+    client = InfluxDBClient(
         host=settings.INFLUXDB_HOST,
         port=settings.INFLUXDB_PORT,
         username=settings.INFLUXDB_USERNAME,
         password=settings.INFLUXDB_PASSWORD,
         ssl=settings.INFLUXDB_SSL,
         verify_ssl=settings.INFLUXDB_SSL,
-        timeout=10)
+        timeout=timeout or settings.INFLUXDB_TIMEOUT)
+    client._session = _get_session()
+    return client
 
 
 def escape(val):
@@ -0,0 +1,263 @@
+from __future__ import absolute_import
+
+import datetime
+import os
+import re
+import sys
+import uuid
+import zlib
+
+import rollbar
+from django.conf import settings
+
+from . import log as analytics_log
+from .spool import Spool
+from .util import geoip_prefetch
+from pinecast.types import StringTypes
+from podcasts.models import Podcast, PodcastEpisode
+
+
+# Ingests listens and feed requests from the CDN logs, which arrive as blobs
+# posted to /services/log. With LOG_SPOOL enabled, the endpoint only appends
+# the blobs to a spool on local disk, and `process_listens` workers do the
+# rest. Blobs are processed at least once: a segment is only removed from the
+# spool after everything in it has been written.
+#
+# Each podcast's blobs are handled by a single partition, so that notification
+# hooks (which compare listen counts before and after a write) never race
+# with another worker processing the same podcast.
+
+
+ts_formats = ['[%d/%b/%Y:%H:%M:%S %z]',
+              '[%d/%b/%Y:%H:%M:%S +0000]',
+              '[%d/%m/%Y:%H:%M:%S +0000]']  # For cdn
+
+MONTHS = {m: i + 1 for i, m in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])}
+TS_REGEX = re.compile(
+    r'^\[(\d{2})/([A-Z][a-z]{2}|\d{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2}) ([+-])(\d{2})(\d{2})\]$')
+
+def parse_ts(raw_ts):
+    # A fast path for `ts_formats`, which would otherwise be tried one by one
+    # with `strptime` for every line of every log.
+    match = TS_REGEX.match(raw_ts or '')
+    if match:
+        day, month, year, hour, minute, second, sign, off_h, off_m = match.groups()
+        try:
+            if month.isdigit():
+                # The numeric format is only ever in UTC, and is naive
+                if (sign, off_h, off_m) == ('+', '00', '00'):
+                    return datetime.datetime(
+                        int(year), int(month), int(day), int(hour), int(minute), int(second))
+            elif month in MONTHS:
+                offset = datetime.timedelta(hours=int(off_h), minutes=int(off_m))
+                return datetime.datetime(
+                    int(year), MONTHS[month], int(day), int(hour), int(minute), int(second),
+                    tzinfo=datetime.timezone(-offset if sign == '-' else offset))
+        except ValueError:
+            pass
+
+    for f in ts_formats:
+        try:
+            return datetime.datetime.strptime(raw_ts, f)
+        except (TypeError, ValueError):
+            continue
+
+    # If we couldn't parse the timestamp, whatever.
+    rollbar.report_message('Got unparseable date: %s' % raw_ts, 'error')
+    return None
+
+
+def _is_valid(blob):
+    if not isinstance(blob, dict):
+        return False
+    if not isinstance(blob.get('episode') or blob.get('feed'), StringTypes):
+        return False
+    # Without these, a blob can't be processed, and a spooled segment holding
+    # one would be retried forever
+    return (
+        isinstance(blob.get('ip'), StringTypes) and bool(blob['ip']) and
+        isinstance(blob.get('userAgent') or '', StringTypes) and
+        isinstance(blob.get('ts'), StringTypes))
+
+def validate(blobs):
+    """Returns the blobs that are worth keeping: listens and feed requests."""
+    return [b for b in blobs if _is_valid(b)]
+
+
+def resolve(blobs):
+    """
+    Returns the blobs, each with the ID of its podcast added, with one query
+    for all of the episodes and one for all of the feeds. Blobs for episodes
+    and podcasts that don't exist are dropped.
+    """
+    ep_ids = set()
+    for blob in blobs:
+        if 'feed' in blob:
+            continue
+        try:
+            ep_ids.add(str(uuid.UUID(blob['episode'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    ep_pods = {
+        str(ep_id): str(pod_id) for ep_id, pod_id in
+        PodcastEpisode.objects.filter(id__in=list(ep_ids)).values_list('id', 'podcast_id')
+    } if ep_ids else {}
+
+    slugs = set(b['feed'] for b in blobs if 'feed' in b)
+    feed_pods = {
+        slug: str(pod_id) for slug, pod_id in
+        Podcast.objects.filter(slug__in=list(slugs)).values_list('slug', 'id')
+    } if slugs else {}
+
+    resolved = []
+    for blob in blobs:
+        if 'feed' in blob:
+            pod_id = feed_pods.get(blob['feed'])
+        else:
+            try:
+                blob['episode'] = str(uuid.UUID(blob['episode']))
+            except (KeyError, TypeError, ValueError):
+                continue
+            pod_id = ep_pods.get(blob['episode'])
+        if pod_id:
+            blob['podcast'] = pod_id
+            resolved.append(blob)
+    return resolved
+
+
+class _PodcastRef(object):
+    def __init__(self, id_):
+        self.id = id_
+
+class _EpisodeRef(object):
+    # Everything `get_listen_obj` needs from an episode, without a query
+    def __init__(self, id_, pod_id):
+        self.id = id_
+        self.podcast = _PodcastRef(pod_id)
+
+
+def process(blobs):
+    """Writes resolved blobs to the analytics back-end(s)."""
+    listen_blobs = [b for b in blobs if 'feed' not in b]
+    subscription_blobs = [b for b in blobs if 'feed' in b]
+
+    # Countries for the whole batch are looked up together, rather than one
+    # IP at a time as each listen is processed
+    geoip_prefetch([b.get('ip') for b in blobs])
+
+    listens_to_log = []
+    for blob in listen_blobs:
+        ts = parse_ts(blob.get('ts'))
+        if ts is None:
+            continue
+
+        try:
+            lo = analytics_log.get_listen_obj(
+                ep=_EpisodeRef(blob['episode'], blob['podcast']),
+                source=blob.get('source'),
+                ip=blob['ip'],
+                ua=blob.get('userAgent') or 'Unknown',
+                timestamp=ts)
+        except Exception:
+            # One bad blob shouldn't hold up the rest of the batch
+            rollbar.report_exc_info(sys.exc_info(), extra_data={'blob': blob})
+            continue
+
+        if lo:
+            listens_to_log.append(lo)
+
+    analytics_log.commit_listens(listens_to_log)
+
+    points = []
+    for blob in subscription_blobs:
+        ts = parse_ts(blob.get('ts'))
+        if ts is None:
+            continue
+
+        # Subscriptions are counted once per subscriber per day, just like
+        # the ones logged from the feed view.
+        try:
+            sub_points = analytics_log.get_subscription_points(
+                blob['podcast'],
+                ip=blob['ip'],
+                ua=blob.get('userAgent') or 'Unknown',
+                ts=datetime.datetime.combine(ts.date(), datetime.time.min))
+        except Exception:
+            rollbar.report_exc_info(sys.exc_info(), extra_data={'blob': blob})
+            continue
+        if sub_points:
+            points.extend(sub_points)
+
+    if points:
+        analytics_log.write_influx_many(settings.INFLUXDB_DB_SUBSCRIPTION, points)
+
+
+def get_incoming_spool():
+    return Spool(os.path.join(settings.LOG_SPOOL_DIR, 'incoming'))
+
+def get_partition_spool(partition):
+    return Spool(os.path.join(settings.LOG_SPOOL_DIR, 'partition-%d' % partition))
+
+def get_partition(pod_id, partitions):
+    return zlib.crc32(pod_id.encode('utf-8')) % partitions
+
+
+def distribute(partitions):
+    """
+    Moves incoming blobs into the spool of the partition for their podcast.
+    Returns the number of blobs moved.
+    """
+    incoming = get_incoming_spool()
+    count = 0
+    for path in incoming.claim():
+        try:
+            grouped = {}
+            for blob in resolve(validate(incoming.read(path))):
+                grouped.setdefault(get_partition(blob['podcast'], partitions), []).append(blob)
+            for partition, blobs in grouped.items():
+                get_partition_spool(partition).write(blobs)
+                count += len(blobs)
+        except Exception:
+            incoming.release(path)
+            raise
+        incoming.remove(path)
+    return count
+
+
+def process_partition(partition, batch_size):
+    """
+    Processes spooled blobs for the partition, in batches of at least
+    `batch_size` blobs where there are that many. Returns the number of blobs
+    processed.
+    """
+    spool = get_partition_spool(partition)
+    count = 0
+    claimed = []
+    blobs = []
+
+    def flush():
+        try:
+            process(blobs)
+        except Exception:
+            for path in claimed:
+                spool.release(path)
+            raise
+        # This is the checkpoint: once the blobs are written, their segments
+        # are gone for good
+        for path in claimed:
+            spool.remove(path)
+
+    for path in spool.claim():
+        claimed.append(path)
+        blobs.extend(spool.read(path))
+        if len(blobs) >= batch_size:
+            flush()
+            count += len(blobs)
+            claimed = []
+            blobs = []
+
+    if claimed:
+        flush()
+        count += len(blobs)
+    return count
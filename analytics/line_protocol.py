@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+
+import calendar
+import collections
+import gzip
+
+from django.conf import settings
+from influxdb.exceptions import InfluxDBClientError, InfluxDBServerError
+
+from .influx import _get_session
+from pinecast.types import StringTypes
+
+
+# Writes points to InfluxDB as line protocol, serialized directly from the
+# points rather than through `InfluxDBClient.write_points`, which rebuilds a
+# dict for every point and formats its timestamp through dateutil. Bodies are
+# gzipped, and big batches are split into several requests.
+
+Point = collections.namedtuple('Point', ['measurement', 'tags', 'fields', 'time'])
+
+GZIP_LEVEL = 6
+
+
+def _escape_key(val):
+    # Measurements, tag keys and values, and field keys
+    return (str(val)
+        .replace('\\', '\\\\')
+        .replace(' ', '\\ ')
+        .replace(',', '\\,')
+        .replace('=', '\\='))
+
+def _escape_field(val):
+    if isinstance(val, bool):
+        return 't' if val else 'f'
+    elif isinstance(val, int):
+        return '%di' % val
+    elif isinstance(val, float):
+        return repr(val)
+    elif isinstance(val, StringTypes):
+        return '"%s"' % val.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    raise Exception('Unknown type %s' % type(val))
+
+
+def get_precision(points):
+    """
+    Returns the coarsest precision that doesn't lose any part of the points'
+    timestamps. Listens are only ever logged to the second, but subscriptions
+    are offset by a hash, in microseconds, to keep subscribers apart.
+    """
+    return 'u' if any(p.time.microsecond for p in points) else 's'
+
+def get_timestamp(time, precision):
+    # Naive datetimes are UTC, as they are to InfluxDBClient
+    seconds = calendar.timegm(time.utctimetuple())
+    if precision == 's':
+        return seconds
+    return seconds * 1000000 + time.microsecond
+
+def make_line(point, precision):
+    key = [_escape_key(point.measurement)]
+    for tag, value in sorted(point.tags.items()):
+        # Influx doesn't accept empty tag values, so they're left off
+        if value is None or value == '':
+            continue
+        key.append('%s=%s' % (_escape_key(tag), _escape_key(value)))
+
+    fields = ','.join(
+        '%s=%s' % (_escape_key(field), _escape_field(value)) for
+        field, value in
+        sorted(point.fields.items()) if
+        value is not None)
+
+    return '%s %s %d' % (','.join(key), fields, get_timestamp(point.time, precision))
+
+def make_body(points, precision):
+    return gzip.compress(
+        ''.join(make_line(p, precision) + '\n' for p in points).encode('utf-8'),
+        compresslevel=GZIP_LEVEL)
+
+
+def write_points(db, points, timeout=None, batch_size=None):
+    """
+    Writes the points to the database, `batch_size` points per request.
+    Returns True, and raises like `InfluxDBClient.write_points` if a request
+    fails.
+    """
+    batch_size = batch_size or settings.INFLUXDB_WRITE_BATCH_SIZE
+    url = '%s://%s:%d/write' % (
+        'https' if settings.INFLUXDB_SSL else 'http',
+        settings.INFLUXDB_HOST,
+        settings.INFLUXDB_PORT)
+    session = _get_session()
+
+    for i in range(0, len(points), batch_size):
+        chunk = points[i:i + batch_size]
+        precision = get_precision(chunk)
+        res = session.post(
+            url,
+            params={
+                'db': db,
+                'precision': precision,
+                'u': settings.INFLUXDB_USERNAME,
+                'p': settings.INFLUXDB_PASSWORD,
+            },
+            data=make_body(chunk, precision),
+            headers={
+                'Content-Type': 'application/octet-stream',
+                'Content-Encoding': 'gzip',
+            },
+            verify=settings.INFLUXDB_SSL,
+            timeout=timeout or settings.INFLUXDB_TIMEOUT)
+
+        if 500 <= res.status_code < 600:
+            raise InfluxDBServerError(res.content)
+        elif res.status_code != 204:
+            raise InfluxDBClientError(res.content, res.status_code)
+
+    return True
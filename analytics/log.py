@@ -4,13 +4,17 @@ from __future__ import print_function
 import datetime
 import hashlib
 import json
+import sys
 
 import rollbar
 from django.conf import settings
+from influxdb.exceptions import InfluxDBClientError
 
 from .analyze import get_device_type, get_request_hash, get_request_ip, get_ts_hash, is_bot
-from .influx import get_client
-from .query import total_listens
+from .dedup import filter_listens, record_listens
+from .line_protocol import Point, write_points
+from .query import total_listens_by
+from .spill import spill as spill_points
 from .util import get_country
 from notifications.models import NotificationHook
 from pinecast.types import StringTypes
@@ -19,21 +23,34 @@ from pinecast.types import StringTypes
 def get_influx_item(measurement, tags, fields, timestamp=None):
     if not timestamp:
         timestamp = datetime.datetime.now()
-    return {
-        'measurement': measurement,
-        'tags': tags,
-        'fields': dict(v=1, **fields),
-        'time': timestamp.isoformat(),
-        'ts_raw': timestamp,
-    }
+    return Point(measurement, tags, dict(v=1, **fields), timestamp)
 
 def write_influx(db, *args):
     return write_influx_many(db, [get_influx_item(*args)])
 
-def write_influx_many(db, items):
-    influx_client = get_client()
+def write_influx_many(db, items, timeout=None):
+    """
+    Writes the points. Points that can't be written because InfluxDB is
+    unavailable are spilled to disk right away, rather than holding up the
+    request; `replay_spilled_points` retries them.
+    Returns whether the points were written or spilled.
+    """
+    if not items:
+        return True
+
+    try:
+        return write_points(db, items, timeout=timeout)
+    except InfluxDBClientError:
+        # The points themselves were rejected, so trying them again won't help
+        rollbar.report_exc_info(sys.exc_info())
+        return False
+    except Exception:
+        if settings.DEBUG:
+            print('Error writing %d points to InfluxDB: %s' % (len(items), sys.exc_info()[1]))
+        else:
+            rollbar.report_exc_info(sys.exc_info())
 
-    return influx_client.write_points(items, database=db)
+    return spill_points(db, items)
 
 
 def get_listen_obj(ep, source, req=None, ip=None, ua=None, timestamp=None):
@@ -103,25 +120,39 @@ def get_listen_obj(ep, source, req=None, ip=None, ua=None, timestamp=None):
 LISTEN_HOOKS = ['first_listen', 'listen_threshold', 'growth_milestone']
 
 def commit_listens(listen_objs):
+    listen_objs = filter_listens(listen_objs)
     if not listen_objs:
         return
-    podcasts = set(x[0]['tags']['podcast'] for _, x in listen_objs)
+    podcasts = set(x[0].tags['podcast'] for _, x in listen_objs)
     hooks = list(NotificationHook.objects.filter(
-                podcast_id__in=list(podcasts),
-                trigger__in=LISTEN_HOOKS))
+        podcast_id__in=list(podcasts),
+        trigger__in=LISTEN_HOOKS))
     podcasts_with_hooks = set(str(h.podcast_id) for h in hooks)
     episodes = set(
-        (x[0]['tags']['podcast'], x[0]['tags']['episode']) for
+        (x[0].tags['podcast'], x[0].tags['episode']) for
         _, x in
         listen_objs if
-        x[0]['tags']['podcast'] in podcasts_with_hooks)
-
-    pod_listens_before = {p: total_listens(p) for p in podcasts_with_hooks}
-    # FIXME: This should pass the episode object, not the episode ID
-    ep_listens_before = {e: (p, total_listens(p, e)) for p, e in episodes}
+        x[0].tags['podcast'] in podcasts_with_hooks)
+
+    def pods_with_trigger(*triggers):
+        return set(str(h.podcast_id) for h in hooks if h.trigger in triggers)
+
+    # Counts for every hooked podcast and episode are fetched together, so
+    # this costs the same number of queries however big the batch is.
+    pod_listens_before = total_listens_by(
+        'podcast', pods_with_trigger('growth_milestone'))
+    ep_pods = pods_with_trigger('first_listen', 'listen_threshold')
+    ep_pod_ids = {e: p for p, e in episodes if p in ep_pods}
+    ep_listens_before = {
+        e: (ep_pod_ids[e], count) for
+        e, count in
+        total_listens_by('episode', ep_pod_ids.keys()).items()
+    }
 
-    write_influx_many(
-        settings.INFLUXDB_DB_LISTEN, [i for _, y in listen_objs for i in y])
+    # Spilled listens will be written by the replay, so they count too
+    if write_influx_many(
+            settings.INFLUXDB_DB_LISTEN, [i for _, y in listen_objs for i in y]):
+        record_listens(listen_objs)
 
     if not podcasts_with_hooks:
         return
@@ -129,14 +160,13 @@ def commit_listens(listen_objs):
     notifications = {p: [n for n in hooks if str(n.podcast_id) == p] for p in podcasts_with_hooks}
 
     from podcasts.models import PodcastEpisode
-    ep_cache = {}
+    ep_cache = {
+        str(ep.id): ep for ep in
+        PodcastEpisode.objects.filter(id__in=list(ep_pod_ids.keys())).select_related('podcast')
+    } if ep_pod_ids else {}
+
     def get_ep(ep_id):
-        if ep_id in ep_cache:
-            return ep_cache.get(ep_id)
-        else:
-            ep = PodcastEpisode.objects.get(id=ep_id)
-            ep_cache[ep_id] = ep
-            return ep
+        return ep_cache[ep_id]
 
     def notify_all(notifications, body={}):
         if not notifications:
@@ -147,7 +177,7 @@ def commit_listens(listen_objs):
     # Handle first_listen notifications
     if any(hook.trigger == 'first_listen' for hook in hooks):
         for ep_id, (pod_id, count) in ep_listens_before.items():
-            if count:
+            if count or ep_id not in ep_cache:
                 continue
             matching_hooks = [h for h in notifications[pod_id] if h.trigger == 'first_listen']
             if not matching_hooks:
@@ -155,37 +185,47 @@ def commit_listens(listen_objs):
             notify_all(matching_hooks, {'episode': get_ep(ep_id)})
 
     # Handle listen_threshold
-    if any(hook.trigger == 'listen_threshold' for hook in hooks):
-        for ep_id, (pod_id, count) in ep_listens_before.items():
-            matching_hooks = [h for h in notifications[pod_id] if h.trigger == 'listen_threshold']
-            if not matching_hooks:
+    threshold_pods = pods_with_trigger('listen_threshold')
+    if threshold_pods:
+        ep_listens_after = total_listens_by(
+            'episode', [e for e, p in ep_pod_ids.items() if p in threshold_pods])
+        for ep_id, new_count in ep_listens_after.items():
+            if ep_id not in ep_cache:
                 continue
+            pod_id, count = ep_listens_before[ep_id]
+            matching_hooks = [h for h in notifications[pod_id] if h.trigger == 'listen_threshold']
             episode = get_ep(ep_id)
-            new_count = total_listens(pod_id, episode)
             notify_all(
                 [h for h in matching_hooks if h.test_condition(count, new_count)],
                 {'episode': episode, 'listens': new_count})
 
     # Handle growth_milestone
-    if any(hook.trigger == 'growth_milestone' for hook in hooks):
+    if pod_listens_before:
+        pod_listens_after = total_listens_by('podcast', pod_listens_before.keys())
         for pod_id, count in pod_listens_before.items():
             matching_hooks = [h for h in notifications[pod_id] if h.trigger == 'growth_milestone']
-            if not matching_hooks:
-                continue
-            new_count = total_listens(pod_id)
+            new_count = pod_listens_after[pod_id]
             notify_all(
                 [h for h in matching_hooks if h.test_condition(count, new_count)],
                 {'listens': new_count, 'before_listens': count})
 
 
 def write_subscription(req, podcast, ts=None, dry_run=False):
-    if is_bot(req=req):
-        if settings.DEBUG:
-            print(('Ignoring bot: %s' % req.META.get('HTTP_USER_AGENT')))
+    points = get_subscription_points(podcast, req=req, ts=ts)
+    if not points or dry_run:
         return
 
-    ip = get_request_ip(req)
-    ua = req.META.get('HTTP_USER_AGENT', 'Unknown') or 'Unknown'
+    write_influx_many(settings.INFLUXDB_DB_SUBSCRIPTION, points)
+
+
+def get_subscription_points(podcast, req=None, ip=None, ua=None, country=None, ts=None):
+    if is_bot(req=req, ua=ua):
+        if settings.DEBUG:
+            print(('Ignoring bot: %s' % (ua or req.META.get('HTTP_USER_AGENT'))))
+        return None
+
+    if not ip: ip = get_request_ip(req)
+    if not ua: ua = req.META.get('HTTP_USER_AGENT', 'Unknown') or 'Unknown'
 
     if isinstance(podcast, StringTypes):
         pod_id = podcast
@@ -193,7 +233,7 @@ def write_subscription(req, podcast, ts=None, dry_run=False):
         pod_id = str(podcast.id)
 
     browser, device, os = get_device_type(req=req, ua=ua)
-    country = get_country(ip, req)
+    if not country: country = get_country(ip, req)
 
     influx_ts = ts or datetime.datetime.combine(datetime.date.today(), datetime.time.min)
     hashed_influx_ts = influx_ts + datetime.timedelta(microseconds=get_ts_hash(ip, ua, influx_ts))
@@ -233,16 +273,7 @@ def write_subscription(req, podcast, ts=None, dry_run=False):
             )
         )
 
-    if dry_run:
-        return
-
-    result = write_influx_many(settings.INFLUXDB_DB_SUBSCRIPTION, points)
-    if not result:
-        if settings.DEBUG:
-            print('Error ingesting data to InfluxDB')
-        else:
-            rollbar.report_message(
-                'Unable to ingest subscription points to influx', 'error')
+    return points
 
 
 def write_notification(notification, failed, is_test=False):
@@ -0,0 +1,28 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.geoip import build_database
+
+
+class Command(BaseCommand):
+    help = ('Builds the embedded GeoIP database from a CSV of IP ranges. Each row has '
+            'either a network (CIDR) or start and end IPs, plus code, city, lat, lon, '
+            'and zip columns. Ranges must not overlap.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source',
+            action='store',
+            dest='source',
+            help='The path to the source CSV file')
+        parser.add_argument('--dest',
+            action='store',
+            dest='dest',
+            default=settings.GEOIP_DB_PATH,
+            help='The path to write the database to')
+
+    def handle(self, *args, **options):
+        with open(options['source'], newline='') as source:
+            count = build_database(source, options['dest'])
+        self.stdout.write('Wrote %d ranges to %s' % (count, options['dest']))
@@ -7,6 +7,8 @@ import re
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from analytics.analyze import get_ua_cache_stats
+from analytics.dedup import get_listen_dedup_stats
 from analytics.log import get_listen_obj, commit_listens
 
 
@@ -111,9 +113,12 @@ class Command(BaseCommand):
                         commit_listens(lobjs)
                     lobjs = []
                     self.stdout.write('Checkpoint: %d lines' % i)
+                    self.stdout.write('UA cache: %(hits)d hits, %(misses)d misses' % get_ua_cache_stats())
+                    self.stdout.write('Dedup: %(dropped)d of %(seen)d listens dropped' % get_listen_dedup_stats())
 
         if dry_run:
             self.stdout.write('Dry run: no results were committed. Use --run to actually run')
         else:
             commit_listens(lobjs)
+            self.stdout.write('Dedup: %(dropped)d of %(seen)d listens dropped' % get_listen_dedup_stats())
 
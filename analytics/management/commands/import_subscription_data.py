@@ -7,6 +7,7 @@ import re
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from analytics.analyze import get_ua_cache_stats
 from analytics.log import write_subscription
 
 
@@ -70,6 +71,7 @@ class Command(BaseCommand):
 
                 if i % 500 == 0:
                     self.stdout.write('Progress: %d lines' % i)
+                    self.stdout.write('UA cache: %(hits)d hits, %(misses)d misses' % get_ua_cache_stats())
 
         if dry_run:
             self.stdout.write('Dry run: no results were committed. Use --run to actually run')
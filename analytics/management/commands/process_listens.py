@@ -0,0 +1,75 @@
+from __future__ import absolute_import
+
+import sys
+import time
+
+import rollbar
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from analytics import ingest
+from analytics.dedup import get_listen_dedup_stats
+
+
+class Command(BaseCommand):
+    help = 'Processes the listens and feed requests spooled by /services/log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partition',
+            action='store',
+            dest='partition',
+            type=int,
+            default=0,
+            help='The partition of podcasts this worker processes, from zero')
+        parser.add_argument('--partitions',
+            action='store',
+            dest='partitions',
+            type=int,
+            default=1,
+            help='The number of workers; the same for every worker')
+        parser.add_argument('--batch-size',
+            action='store',
+            dest='batch_size',
+            type=int,
+            default=settings.LOG_BATCH_SIZE,
+            help='How many blobs to process at a time')
+        parser.add_argument('--interval',
+            action='store',
+            dest='interval',
+            type=int,
+            default=5,
+            help='Seconds to wait when there is nothing to process')
+        parser.add_argument('--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Processes everything spooled so far and exits')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['partition'] < options['partitions']:
+            raise CommandError('--partition must be less than --partitions')
+
+        while True:
+            close_old_connections()
+
+            try:
+                # Every worker helps sort incoming blobs into partitions
+                distributed = ingest.distribute(options['partitions'])
+                processed = ingest.process_partition(options['partition'], options['batch_size'])
+            except Exception:
+                # Whatever failed is still spooled, and is retried
+                rollbar.report_exc_info(sys.exc_info())
+                if options['once']:
+                    raise
+                time.sleep(options['interval'])
+                continue
+
+            if distributed or processed:
+                self.stdout.write('Distributed %d, processed %d' % (distributed, processed))
+                self.stdout.write('Dedup: %(dropped)d of %(seen)d listens dropped' % get_listen_dedup_stats())
+
+            if options['once']:
+                break
+            if not distributed and not processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+
+import sys
+import time
+
+import rollbar
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import spill
+
+
+class Command(BaseCommand):
+    help = ('Writes points that were spilled to disk while InfluxDB was unavailable, in the '
+            'order they were spilled. Must run where INFLUXDB_SPILL_DIR is.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--db',
+            action='append',
+            dest='dbs',
+            help='Only replays points for this database; may be repeated')
+        parser.add_argument('--interval',
+            action='store',
+            dest='interval',
+            type=int,
+            default=30,
+            help='Seconds to wait when there is nothing to replay')
+        parser.add_argument('--max-backoff',
+            action='store',
+            dest='max_backoff',
+            type=int,
+            default=600,
+            help='The most seconds to wait between tries while InfluxDB is down')
+        parser.add_argument('--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Replays everything spilled so far and exits')
+
+    def handle(self, *args, **options):
+        backoff = options['interval']
+        while True:
+            replayed = 0
+            failed = False
+            for db in options['dbs'] or spill.get_spilled_dbs():
+                try:
+                    count = spill.replay(db)
+                except Exception:
+                    # What's left stays spilled, in order, for the next pass
+                    rollbar.report_exc_info(sys.exc_info())
+                    self.stderr.write('Could not replay points for %s: %s' % (db, sys.exc_info()[1]))
+                    failed = True
+                    continue
+                if count:
+                    self.stdout.write('Replayed %d points for %s' % (count, db))
+                replayed += count
+
+            if options['once']:
+                if failed:
+                    raise CommandError('Some points could not be replayed, and are still spilled')
+                break
+            if failed:
+                # Back off exponentially for as long as InfluxDB stays down
+                time.sleep(backoff)
+                backoff = min(backoff * 2, options['max_backoff'])
+                continue
+            backoff = options['interval']
+            if not replayed:
+                time.sleep(options['interval'])
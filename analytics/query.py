@@ -47,6 +47,37 @@ def total_listens(podcast, episode=None):
     return val
 
 
+def total_listens_by(tag, ids):
+    """
+    Returns a dict mapping each podcast or episode ID (per `tag`) to its total
+    listens, all counted with one query. Base listens are not included. If the
+    query fails, every count is -1.
+    """
+    ids = list(ids)
+    if not ids:
+        return {}
+
+    values = {i: settings.INFLUXDB_CONDITION_OVERRIDES.get(tag, i) for i in ids}
+    query = 'SELECT COUNT(v) FROM "listen" WHERE %s GROUP BY %s;' % (
+        ' OR '.join('%s = %s' % (tag, escape(v)) for v in sorted(set(values.values()))),
+        tag)
+
+    if settings.DEBUG:
+        print(query)
+
+    try:
+        result = get_client().query(query, database=settings.INFLUXDB_DB_LISTEN)
+    except Exception:
+        return {i: -1 for i in ids}
+
+    counts = {
+        tags[tag]: list(v)[0]['count'] for
+        (_, tags), v in
+        result.items()
+    }
+    return {i: counts.get(v, 0) for i, v in values.items()}
+
+
 def total_listens_this_week(podcast, tz):
     query = 'SELECT COUNT(v) FROM "listen" WHERE podcast = \'%s\' AND %s;' % (
         settings.INFLUXDB_CONDITION_OVERRIDES.get('podcast', str(podcast.id)),
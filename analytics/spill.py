@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import datetime
+import os
+import sys
+
+import rollbar
+from django.conf import settings
+from influxdb.exceptions import InfluxDBClientError
+
+from .line_protocol import Point, write_points
+from .spool import Spool
+
+
+# Points that can't be written to InfluxDB are spilled to disk, one spool per
+# database, and replayed by `replay_spilled_points` once InfluxDB is back.
+# Writes aren't retried where they're made, since that's often in a request.
+# Segments are named by when they were written, so they are replayed in the
+# order they were spilled.
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+stats = {'spilled': 0, 'dropped': 0}
+
+
+def get_spool(db):
+    return Spool(os.path.join(settings.INFLUXDB_SPILL_DIR, db))
+
+def get_spilled_dbs():
+    try:
+        return sorted(os.listdir(settings.INFLUXDB_SPILL_DIR))
+    except FileNotFoundError:
+        return []
+
+def get_spill_size():
+    # Quarantined segments count too, until someone deals with them
+    size = 0
+    for directory, _, names in os.walk(settings.INFLUXDB_SPILL_DIR):
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+    return size
+
+
+def _dump_point(point):
+    time = point.time
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    delta = time - EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return [point.measurement, point.tags, point.fields, micros]
+
+def _load_point(item):
+    measurement, tags, fields, micros = item
+    return Point(measurement, tags, fields, EPOCH + datetime.timedelta(microseconds=micros))
+
+
+def spill(db, points):
+    """
+    Spills the points to disk. Returns False if they had to be dropped
+    because the spill is full.
+    """
+    try:
+        if get_spill_size() >= settings.INFLUXDB_SPILL_MAX_BYTES:
+            stats['dropped'] += len(points)
+            rollbar.report_message(
+                'InfluxDB spill is full, dropping %d points for %s' % (len(points), db), 'error')
+            return False
+        get_spool(db).write([_dump_point(p) for p in points])
+    except Exception:
+        stats['dropped'] += len(points)
+        rollbar.report_exc_info(sys.exc_info())
+        return False
+
+    stats['spilled'] += len(points)
+    return True
+
+
+def replay(db):
+    """
+    Writes the points spilled for the database, oldest first. Stops at the
+    first segment that can't be written, leaving it and everything after it
+    spilled, and raises. Segments that InfluxDB rejects are quarantined
+    instead. Returns the number of points written.
+    """
+    spool = get_spool(db)
+    count = 0
+    for path in spool.claim():
+        try:
+            points = [_load_point(item) for item in spool.read(path)]
+            if points:
+                write_points(db, points)
+        except InfluxDBClientError:
+            # Trying again won't help, so it's set aside for someone to
+            # look at rather than blocking every segment after it
+            quarantined = spool.quarantine(path)
+            rollbar.report_exc_info(sys.exc_info(), extra_data={'segment': quarantined})
+            continue
+        except Exception:
+            spool.release(path)
+            raise
+        spool.remove(path)
+        count += len(points)
+    return count
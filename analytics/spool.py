@@ -0,0 +1,123 @@
+from __future__ import absolute_import
+
+import json
+import os
+import time
+import uuid
+
+
+class Spool(object):
+    """
+    A directory of segment files, each holding a batch of JSON items, one per
+    line. Segments are written under a temporary name and renamed into place,
+    so readers only ever see complete segments. They are claimed by renaming
+    them, so that when several processes share a spool, only one of them
+    handles each segment.
+    """
+
+    READY = '.jsonl'
+    CLAIMED = '.claimed'
+    TEMP = '.tmp'
+    QUARANTINE = 'quarantine'
+
+    def __init__(self, directory, stale_after=600):
+        self.directory = directory
+        # Claimed segments this old were left behind by a process that died
+        # while handling them, and are handed out again.
+        self.stale_after = stale_after
+
+    def write(self, items):
+        if not items:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+
+        name = '%d-%d-%s' % (int(time.time() * 1000), os.getpid(), uuid.uuid4().hex[:8])
+        path = os.path.join(self.directory, name)
+        with open(path + self.TEMP, 'w') as f:
+            for item in items:
+                f.write(json.dumps(item))
+                f.write('\n')
+            # Callers take a written segment to be safe, so it has to survive
+            # a crash, and so does its name
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + self.TEMP, path + self.READY)
+        self._sync_directory()
+        return path + self.READY
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _list(self):
+        try:
+            return sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+
+    def claim(self):
+        """Yields the paths of segments that this process now owns."""
+        now = time.time()
+        for name in self._list():
+            path = os.path.join(self.directory, name)
+            if name.endswith(self.CLAIMED):
+                try:
+                    if now - os.path.getmtime(path) < self.stale_after:
+                        continue
+                    os.rename(path, path[:-len(self.CLAIMED)] + self.READY)
+                except FileNotFoundError:
+                    continue
+                path = path[:-len(self.CLAIMED)] + self.READY
+            elif not name.endswith(self.READY):
+                continue
+
+            claimed = path[:-len(self.READY)] + self.CLAIMED
+            try:
+                os.rename(path, claimed)
+                # The claim's age is measured from when it was made
+                os.utime(claimed)
+            except FileNotFoundError:
+                # Another process got to it first
+                continue
+            yield claimed
+
+    def read(self, path):
+        items = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    # A partial line from a crash mid-write
+                    continue
+        return items
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release(self, path):
+        """Puts a claimed segment back, to be tried again later."""
+        try:
+            os.rename(path, path[:-len(self.CLAIMED)] + self.READY)
+        except FileNotFoundError:
+            pass
+
+    def quarantine(self, path):
+        """
+        Sets a claimed segment aside, in the spool's quarantine directory, so
+        a segment that can never be handled doesn't hold up the rest.
+        """
+        directory = os.path.join(self.directory, self.QUARANTINE)
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.basename(path)[:-len(self.CLAIMED)] + self.READY
+        try:
+            os.rename(path, os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        return os.path.join(directory, name)
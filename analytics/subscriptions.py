@@ -0,0 +1,162 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import atexit
+import datetime
+import os
+import queue
+import sys
+import threading
+import time
+
+import rollbar
+from django.conf import settings
+from influxdb.exceptions import InfluxDBClientError
+
+from .analyze import get_request_ip
+from .line_protocol import write_points
+from .log import get_subscription_points
+from .spool import Spool
+from .util import geoip_prefetch
+
+
+# Subscriptions are logged off the request path. Feed requests only note who
+# asked for which feed; a background thread in each process spools those
+# events to disk in batches, then parses user agents, looks up countries, and
+# writes them to InfluxDB. Spooled batches that can't be written are retried,
+# including ones left behind by processes that have since exited.
+
+_queue = queue.Queue(maxsize=settings.SUBSCRIPTION_BUFFER_SIZE)
+_lock = threading.Lock()
+_writer_pid = None
+
+stats = {'dropped': 0}
+
+
+def get_spool():
+    return Spool(settings.SUBSCRIPTION_SPOOL_DIR)
+
+
+def log_subscription(req, podcast):
+    event = {
+        'podcast': str(podcast.id),
+        'ip': get_request_ip(req),
+        'ua': req.META.get('HTTP_USER_AGENT', 'Unknown') or 'Unknown',
+        'country': req.META.get('HTTP_CF_IPCOUNTRY'),
+        'date': datetime.date.today().isoformat(),
+    }
+
+    _ensure_writer()
+    try:
+        _queue.put_nowait(event)
+    except queue.Full:
+        # The writer has fallen far behind. Dropping the event is better than
+        # holding up the feed.
+        stats['dropped'] += 1
+
+
+def _ensure_writer():
+    global _writer_pid
+    pid = os.getpid()
+    if _writer_pid == pid:
+        return
+
+    with _lock:
+        # Threads don't survive a fork, so each worker process starts its own
+        if _writer_pid == pid:
+            return
+        thread = threading.Thread(target=_run_writer, name='subscription-writer', daemon=True)
+        thread.start()
+        atexit.register(_spool_pending)
+        _writer_pid = pid
+
+
+def _drain(timeout=None):
+    batch = []
+    try:
+        batch.append(_queue.get(timeout=timeout))
+        while len(batch) < settings.SUBSCRIPTION_BATCH_SIZE:
+            batch.append(_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return batch
+
+
+def _spool_pending():
+    # Called at exit, so anything still buffered survives a restart
+    spool = get_spool()
+    while True:
+        batch = _drain()
+        if not batch:
+            break
+        spool.write(batch)
+
+
+def _run_writer():
+    spool = get_spool()
+    backoff = 0
+    retry_at = 0
+    while True:
+        batch = _drain(timeout=settings.SUBSCRIPTION_FLUSH_INTERVAL)
+        try:
+            spool.write(batch)
+        except Exception:
+            rollbar.report_exc_info(sys.exc_info())
+            continue
+
+        if time.time() < retry_at:
+            continue
+        if flush_spool(spool):
+            backoff = 0
+        else:
+            backoff = min(max(backoff * 2, settings.SUBSCRIPTION_FLUSH_INTERVAL), 300)
+            retry_at = time.time() + backoff
+
+
+def flush_spool(spool):
+    """
+    Writes every spooled subscription to InfluxDB. Returns False if any batch
+    could not be written; those are left in the spool. Batches that InfluxDB
+    rejects are quarantined instead.
+    """
+    for path in spool.claim():
+        try:
+            events = spool.read(path)
+            geoip_prefetch([e.get('ip') for e in events if not e.get('country')])
+
+            points = []
+            for event in events:
+                try:
+                    ts = datetime.datetime.strptime(event['date'], '%Y-%m-%d')
+                    points.extend(
+                        get_subscription_points(
+                            event['podcast'],
+                            ip=event['ip'],
+                            ua=event['ua'],
+                            country=event.get('country'),
+                            ts=ts) or [])
+                except (KeyError, TypeError, ValueError):
+                    # Don't let one malformed event hold up the whole batch
+                    continue
+
+            # Batches that can't be written stay in this spool and are retried
+            # by the writer, so they aren't spilled
+            if points:
+                write_points(settings.INFLUXDB_DB_SUBSCRIPTION, points)
+        except InfluxDBClientError:
+            # InfluxDB rejected the points, so retrying won't help. The batch
+            # is set aside rather than blocking every batch after it.
+            quarantined = spool.quarantine(path)
+            rollbar.report_exc_info(sys.exc_info(), extra_data={'segment': quarantined})
+            continue
+        except Exception:
+            spool.release(path)
+            if settings.DEBUG:
+                print('Error writing spooled subscriptions: %s' % sys.exc_info()[1])
+            else:
+                rollbar.report_exc_info(sys.exc_info())
+            return False
+
+        spool.remove(path)
+
+    return True
@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+from datetime import datetime
+
+from django.test import override_settings
+from nose.tools import eq_
+
+from .. import dedup
+from ..line_protocol import Point
+
+
+TS = datetime(2017, 1, 2, 3, 4, 5)
+
+
+def listen(episode, source='direct', l_id='0123456789abcdef0123456789abcdef01234567'):
+    tags = {'podcast': 'pod', 'episode': episode, 'source': source}
+    return (None, [Point('listen', tags, {'l_id': l_id, 'v': 1}, TS)])
+
+
+def test_deduplicator():
+    d = dedup.WindowedDeduplicator(3600, 100)
+    eq_(d.filter(['aa' * 8, 'bb' * 8, 'aa' * 8]), [0, 1])
+    eq_(d.filter(['aa' * 8]), [0])  # Not recorded yet
+    d.record(['aa' * 8])
+    eq_(d.filter(['aa' * 8, 'cc' * 8]), [1])
+    eq_(d.get_stats()['dropped'], 2)
+
+def test_deduplicator_bounded():
+    d = dedup.WindowedDeduplicator(3600, 4)
+    d.record(['aa' * 8, 'bb' * 8])
+    d.record(['cc' * 8, 'dd' * 8])
+    d.record(['ee' * 8])
+    # The oldest generation was forgotten to make room
+    eq_(d.filter(['aa' * 8, 'cc' * 8]), [0])
+    assert d.get_stats()['size'] <= 4
+
+@override_settings(LISTEN_DEDUP_WINDOW=3600)
+def test_filter_listens_same_second():
+    dedup._listens.clear()
+    # One client downloading several episodes at once
+    listens = [listen('ep-a'), listen('ep-b'), listen('ep-a', source='embed')]
+    eq_(dedup.filter_listens(listens), listens)
+    dedup.record_listens(listens)
+    eq_(dedup.filter_listens([listen('ep-a'), listen('ep-c')]), [listen('ep-c')])
+    dedup._listens.clear()
@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+
+import io
+import os
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from ..geoip import EmbeddedGeoIPProvider, build_database
+
+
+SOURCE = '''network,start,end,code,city,lat,lon,zip
+,1.0.0.0,1.0.0.255,AU,Brisbane,-27.4,153.0,4000
+10.0.0.0/24,,,US,Boston,42.3,-71.0,02101
+,10.0.1.128,10.0.1.255,CA,Toronto,43.6,-79.3,
+2001:db8::/32,,,DE,Berlin,52.5,13.4,10115
+'''
+
+
+def with_provider(test):
+    def wrapped():
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'geoip.db')
+            eq_(build_database(io.StringIO(SOURCE), path), 4)
+            test(EmbeddedGeoIPProvider(path))
+        finally:
+            shutil.rmtree(root)
+    wrapped.__name__ = test.__name__
+    return wrapped
+
+
+def code(provider, ip):
+    location = provider.lookup(ip)
+    return location['code'] if location else None
+
+
+@with_provider
+def test_lookup_ipv4(provider):
+    eq_(provider.lookup('10.0.0.42'), {
+        'code': 'US', 'city': 'Boston', 'lat': '42.3', 'lon': '-71.0', 'zip': '02101'})
+    eq_(code(provider, '1.0.0.7'), 'AU')
+
+@with_provider
+def test_lookup_range_boundaries(provider):
+    eq_(code(provider, '10.0.0.0'), 'US')
+    eq_(code(provider, '10.0.0.255'), 'US')
+    eq_(code(provider, '10.0.1.128'), 'CA')
+    eq_(code(provider, '10.0.1.255'), 'CA')
+
+@with_provider
+def test_lookup_gaps(provider):
+    # Before the first range, between ranges, and after the last IPv4 range
+    eq_(code(provider, '0.255.255.255'), None)
+    eq_(code(provider, '1.0.1.0'), None)
+    eq_(code(provider, '10.0.1.0'), None)
+    eq_(code(provider, '10.0.1.127'), None)
+    eq_(code(provider, '10.0.2.0'), None)
+    eq_(code(provider, '255.255.255.255'), None)
+
+@with_provider
+def test_lookup_ipv6(provider):
+    eq_(code(provider, '2001:db8::1'), 'DE')
+    eq_(code(provider, '2001:db8:ffff:ffff:ffff:ffff:ffff:ffff'), 'DE')
+    eq_(code(provider, '2001:db9::'), None)
+    eq_(code(provider, '::1'), None)
+    # IPv4 addresses written as mapped IPv6 addresses are the same addresses
+    eq_(code(provider, '::ffff:10.0.0.1'), 'US')
+
+@with_provider
+def test_lookup_invalid(provider):
+    eq_(provider.lookup('not an ip'), None)
+    eq_(provider.lookup(''), None)
+    eq_(provider.lookup('10.0.0.256'), None)
+    eq_(provider.lookup_bulk(['10.0.0.1', 'nope']), [
+        {'code': 'US', 'city': 'Boston', 'lat': '42.3', 'lon': '-71.0', 'zip': '02101'}, None])
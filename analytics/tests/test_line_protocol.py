@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+
+import gzip
+from datetime import datetime, timedelta, timezone
+
+from nose.tools import eq_
+
+from ..line_protocol import Point, get_precision, get_timestamp, make_body, make_line
+
+
+TS = datetime(2017, 1, 2, 3, 4, 5)
+
+
+def test_make_line():
+    eq_(make_line(Point('listen', {'podcast': 'abc', 'source': 'direct'}, {'v': 1}, TS), 's'),
+        'listen,podcast=abc,source=direct v=1i 1483326245')
+
+def test_make_line_escaping():
+    point = Point(
+        'my measurement,x',
+        {'a b': 'c,d=e', 'back': 'slash\\'},
+        {'ua': 'Mozilla "5.0"\\\nnext', 'f': 1.5, 'b': True},
+        TS)
+    eq_(make_line(point, 's'),
+        'my\\ measurement\\,x,a\\ b=c\\,d\\=e,back=slash\\\\ '
+        'b=t,f=1.5,ua="Mozilla \\"5.0\\"\\\\\\nnext" 1483326245')
+
+def test_make_line_skips_empty_values():
+    point = Point('listen', {'country': '', 'os': None, 'podcast': 'abc'}, {'v': 1, 'ip': None}, TS)
+    eq_(make_line(point, 's'), 'listen,podcast=abc v=1i 1483326245')
+
+def test_get_precision():
+    eq_(get_precision([Point('listen', {}, {}, TS)]), 's')
+    eq_(get_precision([
+        Point('listen', {}, {}, TS),
+        Point('subscription', {}, {}, TS + timedelta(microseconds=12)),
+    ]), 'u')
+
+def test_get_timestamp():
+    eq_(get_timestamp(TS, 's'), 1483326245)
+    eq_(get_timestamp(TS + timedelta(microseconds=12), 'u'), 1483326245000012)
+    # Aware timestamps are converted to UTC; naive ones are taken as UTC
+    eq_(get_timestamp(TS.replace(tzinfo=timezone(timedelta(hours=-5))), 's'), 1483326245 + 5 * 3600)
+
+def test_make_body():
+    points = [Point('listen', {}, {'v': 1}, TS), Point('listen', {}, {'v': 2}, TS)]
+    eq_(gzip.decompress(make_body(points, 's')),
+        b'listen v=1i 1483326245\nlisten v=2i 1483326245\n')
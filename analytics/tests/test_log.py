@@ -0,0 +1,53 @@
+from __future__ import absolute_import
+
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from nose.tools import eq_
+
+from ..log import commit_listens, get_influx_item
+from notifications.models import NotificationHook
+from podcasts.benchmarks import build_podcast
+
+
+@override_settings(LISTEN_DEDUP_WINDOW=0)
+class ListenThresholdTest(TestCase):
+
+    def setUp(self):
+        self.pod, _ = build_podcast(1)
+        self.ep = self.pod.get_all_episodes_raw().get()
+        self.ep.stats_base_listens = 1000
+        self.ep.save()
+        NotificationHook.objects.create(
+            podcast=self.pod,
+            destination_type='webhook',
+            destination='https://example.com/hook',
+            trigger='listen_threshold',
+            condition='500')
+
+    def commit(self, before, after):
+        counts = [before, after]
+
+        def total_listens_by(tag, ids):
+            return {str(self.ep.id): counts.pop(0)} if tag == 'episode' else {}
+
+        listen = get_influx_item(
+            'listen',
+            {'podcast': str(self.pod.id), 'episode': str(self.ep.id), 'source': 'direct'},
+            {'l_id': '0123456789abcdef0123456789abcdef01234567'})
+        with mock.patch('analytics.log.total_listens_by', side_effect=total_listens_by), \
+                mock.patch('analytics.log.write_influx_many', return_value=True), \
+                mock.patch.object(NotificationHook, 'execute') as execute:
+            commit_listens([(None, [listen])])
+        return execute
+
+    def test_threshold_counts_exclude_base_listens(self):
+        # Both counts come straight from InfluxDB; base listens are never
+        # added, so they can't push an episode over its threshold
+        execute = self.commit(10, 11)
+        eq_(execute.call_count, 0)
+
+    def test_threshold_crossed(self):
+        execute = self.commit(499, 500)
+        eq_(execute.call_count, 1)
+        eq_(execute.call_args[0][0]['listens'], 500)
@@ -0,0 +1,34 @@
+from __future__ import absolute_import
+
+from unittest import mock
+
+from nose.tools import eq_
+
+from .. import util
+
+
+LOOKUP = {'code': 'US', 'city': 'Boston', 'lat': '42.3', 'lon': '-71.0', 'zip': '02101'}
+
+
+def setup():
+    util._geoip_cache.clear()
+    util._geoip_failures.clear()
+
+def teardown():
+    setup()
+
+
+def test_geoip_lookup_cached():
+    setup()
+    with mock.patch.object(util, 'geoip_lookup_bulk', return_value=[LOOKUP, None]) as bulk:
+        eq_(util.geoip_lookup_cached(['1.1.1.1', '2.2.2.2', '1.1.1.1']), [LOOKUP, None, LOOKUP])
+        eq_(util.geoip_lookup_cached(['1.1.1.1', '2.2.2.2']), [LOOKUP, None])
+        eq_(bulk.call_count, 1)
+
+def test_geoip_failures_are_not_retried_right_away():
+    setup()
+    with mock.patch.object(util, 'geoip_lookup_bulk', return_value=None) as bulk:
+        util.geoip_prefetch(['3.3.3.3', '4.4.4.4'])
+        eq_(util.get_country('3.3.3.3'), None)
+        eq_(util.get_country('4.4.4.4'), None)
+        eq_(bulk.call_count, 1)
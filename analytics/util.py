@@ -2,15 +2,16 @@ import collections
 import json
 import os.path
 
-import requests
-import rollbar
 from functools import wraps
 
+from django.conf import settings
 from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 
 import accounts.payment_plans as plans
+from .geoip import get_provider as get_geoip_provider
 from accounts.models import UserSettings
 from dashboard.views import get_podcast
+from pinecast.lru import LRUCache
 from pinecast.types import StringTypes
 
 
@@ -20,18 +21,54 @@ def get_country(ip, req=None):
     if ip == '127.0.0.1':
         return 'US'
 
-    lookup = geoip_lookup_bulk([ip])
+    lookup = geoip_lookup_cached([ip])
     if not lookup or not lookup[0] or not lookup[0]['code']:
         return None
     return lookup[0]['code']
 
 def geoip_lookup_bulk(ips):
-    try:
-        res = requests.post('https://geoip.service.pinecast.com:444/bulk', json=ips, timeout=4)
-        return res.json()
-    except Exception as e:
-        rollbar.report_message('[pinecast geoip] Error resolving country IP (%s): %s' % (ip, str(e)), 'error')
-        return None
+    return get_geoip_provider().lookup_bulk(ips)
+
+
+_geoip_cache = LRUCache(settings.GEOIP_CACHE_SIZE, ttl=settings.GEOIP_CACHE_TTL)
+# IPs whose lookup just failed. While GeoIP is down, everything asking about
+# them gets no answer straight away instead of waiting on a request of its own.
+_geoip_failures = LRUCache(settings.GEOIP_CACHE_SIZE, ttl=settings.GEOIP_FAILURE_TTL)
+_missing = object()
+
+def geoip_lookup_cached(ips):
+    """
+    Like `geoip_lookup_bulk`, but answers from a cache of recent lookups where
+    it can, and looks the rest up in as few requests as possible. Returns a
+    list of lookups in the same order as `ips`, with None for any IP that
+    couldn't be resolved (or recently failed to be).
+    """
+    results = {}
+    misses = []
+    for ip in set(ips):
+        cached = _geoip_cache.get(ip, _missing)
+        if cached is not _missing:
+            results[ip] = cached
+        elif not _geoip_failures.get(ip):
+            misses.append(ip)
+
+    for i in range(0, len(misses), settings.GEOIP_BULK_SIZE):
+        chunk = misses[i:i + settings.GEOIP_BULK_SIZE]
+        lookups = geoip_lookup_bulk(chunk)
+        if not lookups:
+            # These are only tried again once GEOIP_FAILURE_TTL has passed
+            for ip in chunk:
+                _geoip_failures.set(ip, True)
+            continue
+        for ip, lookup in zip(chunk, lookups):
+            _geoip_cache.set(ip, lookup)
+            results[ip] = lookup
+
+    return [results.get(ip) for ip in ips]
+
+def geoip_prefetch(ips):
+    """Resolves a batch of IPs ahead of time, so `get_country` finds them cached."""
+    geoip_lookup_cached([ip for ip in set(ips) if ip and ip != '127.0.0.1'])
 
 
 def restrict(minimum_plan):
@@ -74,20 +111,17 @@ def format_ip_list(formatter, label):
     ip_counter = collections.Counter(formatter.get_resulting_value('ip'))
     ip_counts = ip_counter.most_common(200)
 
-    lookups = geoip_lookup_bulk([x for x, _ in ip_counts])
-
-    def extend(x, **kw):
-        x.update(kw)
-        return x
+    lookups = geoip_lookup_cached([x for x, _ in ip_counts])
 
-    geo_index = {
-        (x['lat'], x['lon']): extend(x, lat=float(x['lat']), lon=float(x['lon'])) for
-        x in lookups if x and x['zip']}
+    # Lookups are shared through the cache, so they're copied, not modified
+    geo_index = {}
     c = collections.Counter()
-    for i, x in enumerate(lookups):
+    for (_, count), x in zip(ip_counts, lookups):
         if not x or not x['zip']:
             continue
-        c[(x['lat'], x['lon'])] += ip_counts[i][1]
+        coord = (x['lat'], x['lon'])
+        geo_index[coord] = dict(x, lat=float(x['lat']), lon=float(x['lon']))
+        c[coord] += count
 
     return [dict(count=count, **geo_index[coord], label=geo_index[coord][label]) for coord, count in c.items()]
 
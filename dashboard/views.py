@@ -254,6 +254,7 @@ def edit_podcast(req, podcast_slug):
         pod.language = req.POST.get('language')
         pod.copyright = req.POST.get('copyright')
         pod.author_name = req.POST.get('author_name')
+        pod.feed_item_limit = int(req.POST.get('feed_item_limit')) if req.POST.get('feed_item_limit') else None
         pod.cover_image = signer.unsign(req.POST.get('image-url'))
         pod.set_category_list(req.POST.get('categories'))
         pod.full_clean()
@@ -3,11 +3,14 @@ import uuid
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy
 
 from .stripe_lib import stripe
 from accounts.models import UserSettings
 from payments.mixins import StripeCustomerMixin
+from podcasts import feed_cache
 from podcasts.models import Podcast
 
 
@@ -105,3 +108,8 @@ class TipEvent(models.Model):
 
     def __str__(self):
         return '%s to %s - %s' % (self.amount, self.podcast.name, self.occurred_at.strftime('%x %X'))
+
+
+@receiver([post_save, post_delete], sender=RecurringTip)
+def _recurring_tip_changed(sender, instance, **kwargs):
+    feed_cache.invalidate_subscriber(instance.podcast_id, instance.tipper.uuid)
@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+POLL_INTERVAL = 0.05  # Seconds
+
+
+def _lock_key(key):
+    return 'coalesce:lock:%s' % key
+
+def _result_key(key, token):
+    return 'coalesce:result:%s:%s' % (key, token)
+
+
+def coalesce(key, func):
+    """
+    Calls `func` and returns its result, unless a call for the same key is
+    already running in another request. In that case, this waits for that
+    call to finish and returns its result instead, so that a burst of
+    identical requests does the work only once. If the other call fails or
+    takes too long, `func` is called here after all.
+
+    The result must be picklable, since it is handed over through the cache.
+    """
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(key), token, settings.COALESCE_LOCK_TIMEOUT):
+        try:
+            result = func()
+            cache.set(_result_key(key, token), result, settings.COALESCE_WAIT)
+            return result
+        finally:
+            cache.delete(_lock_key(key))
+
+    # Each call gets its own token, so we only ever pick up the result of the
+    # call that's running now, and never one left over from an earlier one.
+    token = cache.get(_lock_key(key))
+    deadline = time.time() + settings.COALESCE_WAIT
+    while token is not None and time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        result = cache.get(_result_key(key, token))
+        if result is not None:
+            return result
+        if cache.get(_lock_key(key)) != token:
+            # It finished without leaving a result, most likely by raising
+            result = cache.get(_result_key(key, token))
+            if result is not None:
+                return result
+            break
+
+    return func()
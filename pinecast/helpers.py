@@ -5,6 +5,7 @@ from functools import wraps
 
 import bleach
 import django.core.urlresolvers
+import gfm
 import requests
 from django.conf import settings
 from django.core.urlresolvers import reverse as reverse_django
@@ -75,6 +76,31 @@ def sanitize_hard(data):
     )
 
 
+def render_markdown(source):
+    return sanitize(gfm.markdown(source))
+
+def get_rendered_markdown(instance, source, field, persist=True):
+    """
+    Returns the sanitized HTML for the Markdown `source`. The HTML is stored on
+    `instance` in `field`, alongside a hash of the source it was rendered from
+    in `<field>_source_hash`, so it's only rendered again when the source
+    changes. With `persist`, a fresh rendering is written straight to the
+    database without going through `save()`.
+    """
+    source_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    hash_field = '%s_source_hash' % field
+    if getattr(instance, hash_field) == source_hash:
+        return getattr(instance, field)
+
+    html = render_markdown(source)
+    setattr(instance, field, html)
+    setattr(instance, hash_field, source_hash)
+    if persist and instance.pk:
+        type(instance).objects.filter(pk=instance.pk).update(
+            **{field: html, hash_field: source_hash})
+    return html
+
+
 def validate_recaptcha(response, ip):
     if settings.DEBUG:
         return True
@@ -15,6 +15,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 import logging
 import os
+import tempfile
 
 import mimetypes
 
@@ -177,6 +178,19 @@ except Exception:
     }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+}
+# Anything that's invalidated when content changes (rendered feeds, private
+# feed access, /listen targets) is only cached when every process shares the
+# cache. A local-memory cache can only be invalidated in the process that made
+# the change, so the others would keep serving stale content.
+CACHE_SHARED = not CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache'))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -252,6 +266,64 @@ SUPPORT_EMAIL = 'support@pinecast.zendesk.com'
 SENDER_EMAIL = 'Matt@pinecast.com'
 
 
+# Identical renders that overlap are done once, with the other requests waiting
+# for the result. The lock timeout bounds how long a render can hold others up.
+COALESCE_LOCK_TIMEOUT = 30
+COALESCE_WAIT = 10
+
+FEED_CACHE_TTL = 3600 * 24
+FEED_ITEM_CACHE_TTL = 3600 * 24 * 7
+FEED_SUBSCRIBER_CACHE_TTL = 60 * 5
+FEED_STREAMING_MIN_EPISODES = 500
+# Feeds may be held by clients for an hour per day between episodes, within
+# these bounds (in seconds)
+FEED_MAX_AGE_MIN = 120
+FEED_MAX_AGE_MAX = 3600 * 3
+FEED_CADENCE_EPISODES = 10
+
+# Public feeds are written to storage whenever they change and served from the
+# CDN. Subscriptions to them are counted from the CDN's logs.
+STATIC_FEEDS = os.environ.get('STATIC_FEEDS', 'False') == 'True'
+STATIC_FEEDS_BUCKET = os.environ.get('STATIC_FEEDS_BUCKET')
+# Set to write static feeds to a local directory instead of S3
+STATIC_FEEDS_DIR = os.environ.get('STATIC_FEEDS_DIR')
+STATIC_FEEDS_PUBLISH_DELAY = 5  # Seconds to wait for more changes before publishing
+
+# Feed subscriptions are buffered in memory, spooled to disk, and written to
+# InfluxDB in batches by a background thread.
+SUBSCRIPTION_BUFFER_SIZE = 10000
+SUBSCRIPTION_BATCH_SIZE = 500
+SUBSCRIPTION_FLUSH_INTERVAL = 5  # Seconds
+SUBSCRIPTION_SPOOL_DIR = os.environ.get(
+    'SUBSCRIPTION_SPOOL_DIR',
+    os.path.join(tempfile.gettempdir(), 'pinecast-subscriptions'))
+
+# Where /listen redirects each episode is cached in every process for a short
+# time, and in the shared cache until the episode changes. Set the shared TTL
+# to 0 to only use the in-process cache, which is the default when the cache
+# isn't shared.
+LISTEN_CACHE_SIZE = 10000
+LISTEN_CACHE_LOCAL_TTL = 60
+LISTEN_CACHE_SHARED_TTL = int(os.environ.get(
+    'LISTEN_CACHE_SHARED_TTL', 3600 * 24 if CACHE_SHARED else 0))
+
+# With LOG_SPOOL on, /services/log only writes what it's sent to disk, and the
+# process_listens workers (which must share LOG_SPOOL_DIR) do the rest.
+LOG_SPOOL = os.environ.get('LOG_SPOOL', 'False') == 'True'
+LOG_SPOOL_DIR = os.environ.get(
+    'LOG_SPOOL_DIR',
+    os.path.join(tempfile.gettempdir(), 'pinecast-listens'))
+LOG_BATCH_SIZE = 5000
+
+# Points that can't be written to InfluxDB are spilled here, until the
+# replay_spilled_points command writes them. Once the spill reaches its size
+# limit, further points are dropped.
+INFLUXDB_SPILL_DIR = os.environ.get(
+    'INFLUXDB_SPILL_DIR',
+    os.path.join(tempfile.gettempdir(), 'pinecast-influx-spill'))
+INFLUXDB_SPILL_MAX_BYTES = int(os.environ.get('INFLUXDB_SPILL_MAX_BYTES', 256 * 1024 * 1024))
+
+
 INFLUXDB_USERNAME = os.environ.get('INFLUXDB_USERNAME')
 INFLUXDB_PASSWORD = os.environ.get('INFLUXDB_PASSWORD')
 INFLUXDB_DB_SUBSCRIPTION = os.environ.get('INFLUXDB_DB_SUBSCRIPTION', 'subscription')
@@ -274,6 +346,21 @@ ROLLBAR = {
 INFLUXDB_HOST = 'influx.service.pinecast.com'
 INFLUXDB_PORT = 443
 INFLUXDB_SSL = True
+INFLUXDB_POOL_SIZE = 10
+INFLUXDB_TIMEOUT = 10  # Seconds
+INFLUXDB_WRITE_BATCH_SIZE = 5000  # Points per write request
+
+UA_CACHE_SIZE = 10000
+LISTEN_DEDUP_WINDOW = 3600  # Seconds; zero disables deduplication
+LISTEN_DEDUP_SIZE = 200000  # Listen IDs remembered per process
+GEOIP_CACHE_SIZE = 50000
+GEOIP_CACHE_TTL = 3600 * 24
+GEOIP_FAILURE_TTL = 60  # Seconds before IPs that failed to resolve are tried again
+GEOIP_BULK_SIZE = 500
+# 'remote' uses the GeoIP service; 'embedded' reads a database built with the
+# build_geoip_db command from GEOIP_DB_PATH
+GEOIP_PROVIDER = os.environ.get('GEOIP_PROVIDER', 'remote')
+GEOIP_DB_PATH = os.environ.get('GEOIP_DB_PATH', os.path.join(BASE_DIR, 'geoip.db'))
 
 INFLUXDB_CONDITION_OVERRIDES = {}
 
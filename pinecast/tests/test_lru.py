@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+
+import time
+
+from nose.tools import eq_
+
+from ..lru import LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    eq_(cache.get('a'), 1)
+    cache.set('c', 3)
+    eq_(cache.get('b'), None)
+    eq_(cache.get('a'), 1)
+    eq_(cache.get('c'), 3)
+    eq_(cache.get_stats()['hits'], 3)
+    eq_(cache.get_stats()['misses'], 1)
+
+def test_lru_expires_entries():
+    cache = LRUCache(2, ttl=0.01)
+    cache.set('a', 1)
+    eq_(cache.get('a'), 1)
+    time.sleep(0.02)
+    eq_(cache.get('a'), None)
+    eq_(len(cache), 0)
+
+def test_lru_delete():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.delete('a')
+    cache.delete('missing')
+    eq_(cache.get('a', 'default'), 'default')
@@ -1,15 +1,13 @@
-import datetime
 import json
 import re
 from urllib.parse import urlparse
 
-import rollbar
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.http import Http404, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
-import analytics.log as analytics_log
+import analytics.ingest as analytics_ingest
 from .canny import get_anonymous_name, get_canny_token
 from .helpers import get_object_or_404, json_response, render, reverse
 from .jinja2_helper import thumbnail
@@ -19,10 +17,6 @@ from podcasts.models import PodcastEpisode
 from podcasts.urls import LISTEN_REGEX
 
 
-ts_formats = ['[%d/%b/%Y:%H:%M:%S %z]',
-              '[%d/%b/%Y:%H:%M:%S +0000]',
-              '[%d/%m/%Y:%H:%M:%S +0000]']  # For cdn
-
 @csrf_exempt
 def log(req):
     if req.GET.get('access') != settings.LAMBDA_ACCESS_SECRET:
@@ -37,38 +31,12 @@ def log(req):
     if not isinstance(parsed, list):
         return HttpResponse(status=400)
 
-    listens_to_log = []
-
-    for blob in parsed:
-        try:
-            ep = PodcastEpisode.objects.get(id=blob['episode'])
-        except PodcastEpisode.DoesNotExist:
-            continue
-
-        raw_ts = blob.get('ts')
-        ts = None
-        for f in ts_formats:
-            try:
-                ts = datetime.datetime.strptime(raw_ts, f)
-                break
-            except ValueError:
-                continue
-        else:
-            # If we couldn't parse the timestamp, whatever.
-            rollbar.report_message('Got unparseable date: %s' % raw_ts, 'error')
-            continue
-
-        lo = analytics_log.get_listen_obj(
-            ep=ep,
-            source=blob.get('source'),
-            ip=blob.get('ip'),
-            ua=blob.get('userAgent'),
-            timestamp=ts)
-
-        if lo:
-            listens_to_log.append(lo)
-
-    analytics_log.commit_listens(listens_to_log)
+    blobs = analytics_ingest.validate(parsed)
+    if settings.LOG_SPOOL:
+        # Processed by the `process_listens` workers
+        analytics_ingest.get_incoming_spool().write(blobs)
+    else:
+        analytics_ingest.process(analytics_ingest.resolve(blobs))
 
     return HttpResponse(status=204)
 
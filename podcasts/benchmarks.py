@@ -0,0 +1,205 @@
+from __future__ import absolute_import
+
+import datetime
+import time
+import tracemalloc
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+import accounts.payment_plans as plans
+from .models import FlairContext, Podcast, PodcastEpisode
+from accounts.models import UserSettings
+from payments.models import RecurringTip, TipUser
+from sites.models import Site
+
+
+SIZES = (10, 100, 1000, 5000)
+VIEWS = ('feed', 'feed_private', 'site_home', 'oembed')
+
+# The cache is cleared before every view, so the benchmarks get one of their
+# own rather than the one configured for the app
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pinecast-benchmarks',
+    },
+}
+LOCAL_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+
+SHORT_NOTES = 'A short episode description.'
+LONG_NOTES = '\n\n'.join(
+    ['# Show Notes'] +
+    ['- [Link number %d](https://example.com/%d) with some *emphasis* and `code`' % (i, i) for i in range(40)] +
+    ['Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20] * 10)
+
+
+def build_podcast(episode_count, flair=False, long_notes=False):
+    """
+    Creates a podcast owned by a Pro user with a site, a private feed
+    subscriber, and `episode_count` published episodes. Returns the podcast
+    and the subscriber's UUID.
+    """
+    suffix = uuid.uuid4().hex[:12]
+    user = User.objects.create_user('bench-%s' % suffix, 'bench-%s@example.com' % suffix, 'bench')
+    us = UserSettings.get_from_user(user)
+    us.plan = plans.PLAN_PRO
+    us.coupon_code = 'BENCH' if flair else None
+    us.save()
+
+    pod = Podcast.objects.create(
+        slug='bench-%s' % suffix,
+        name='Benchmark Podcast %s' % suffix,
+        cover_image='https://example.com/cover.jpg',
+        description='A podcast for benchmarking feed rendering',
+        homepage='https://example.com',
+        author_name='Benchmark',
+        owner=user)
+    Site.objects.create(podcast=pod, theme='unstyled')
+
+    now = datetime.datetime.now()
+    PodcastEpisode.objects.bulk_create(
+        PodcastEpisode(
+            podcast=pod,
+            title='Episode %d' % i,
+            subtitle='Subtitle for episode %d' % i,
+            publish=now - datetime.timedelta(days=i + 1),
+            description=LONG_NOTES if long_notes else SHORT_NOTES,
+            duration=3600,
+            audio_url='https://example.com/audio/%d.mp3' % i,
+            audio_size=50 * 1024 * 1024,
+            audio_type='audio/mp3',
+            image_url='https://example.com/episode/%d.jpg' % i,
+            flair_feedback=flair,
+            flair_site_link=flair,
+            flair_powered_by=flair,
+            flair_referral_code=flair,
+        ) for i in range(episode_count))
+
+    # `bulk_create` skips `save()`, so render the stored descriptions the way
+    # saving each episode would have.
+    flair_context = FlairContext(pod)
+    for ep in pod.get_all_episodes_raw():
+        setattr(ep, 'podcast', pod)
+        ep.get_html_description(flair=flair_context)
+
+    tipper = TipUser.objects.create(email_address='tipper-%s@example.com' % suffix)
+    RecurringTip.objects.create(
+        tipper=tipper,
+        podcast=pod,
+        amount=500,
+        stripe_customer_id='bench',
+        stripe_subscription_id='bench')
+
+    return pod, str(tipper.uuid)
+
+
+def measure(func):
+    """
+    Calls `func`, which should return a response, and consumes the response.
+    Returns the wall time in milliseconds, the number of queries, and the
+    peak memory allocated in bytes.
+    """
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            resp = func()
+            if resp.streaming:
+                size = sum(len(chunk) for chunk in resp.streaming_content)
+            else:
+                size = len(resp.content)
+            duration = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': resp.status_code,
+        'wall_ms': round(duration * 1000, 3),
+        'queries': len(queries),
+        'peak_memory': peak,
+        'response_bytes': size,
+    }
+
+
+def _get_requests(pod, subscriber, episode):
+    from pinecast.views import oembed
+    from sites.views import site_home
+    from .views import feed, feed_private
+
+    factory = RequestFactory()
+
+    def request(path, **kwargs):
+        req = factory.get(path, HTTP_USER_AGENT='Benchmark/1.0', **kwargs)
+        req.user = AnonymousUser()
+        return req
+
+    def site_req():
+        req = request('/')
+        req.META['site_hostname'] = True
+        return req
+
+    return {
+        'feed': lambda: feed(request('/feed/%s' % pod.slug), podcast_slug=pod.slug),
+        'feed_private': lambda: feed_private(
+            request('/feed/%s/sub/%s' % (pod.slug, subscriber)),
+            podcast_slug=pod.slug,
+            subscriber=subscriber),
+        'site_home': lambda: site_home(site_req(), podcast_slug=pod.slug),
+        'oembed': lambda: oembed(
+            request('/services/oembed.json', data={'url': 'https://pinecast.com/listen/%s' % episode.id})),
+    }
+
+
+def is_local_database():
+    if connection.vendor == 'sqlite':
+        return True
+    return (connection.vendor == 'postgresql' and
+            connection.settings_dict.get('HOST') in LOCAL_HOSTS)
+
+
+def run(sizes=SIZES, views=VIEWS, log=None):
+    """
+    Runs every view against every combination of size, flair, and long
+    notes. Each view is measured cold (with an empty cache) and then warm.
+    Nothing created here is committed to the database, but the benchmarks
+    still refuse to run anywhere but a local one.
+    """
+    if not is_local_database():
+        raise Exception('Benchmarks only run against a local SQLite or Postgres database')
+
+    results = []
+    # Subscriptions would otherwise be queued for InfluxDB on every request.
+    # Within this one process, the benchmark cache is as good as shared.
+    with mock.patch('analytics.subscriptions.log_subscription'), \
+            override_settings(CACHES=BENCHMARK_CACHES, CACHE_SHARED=True), \
+            transaction.atomic():
+        for size in sizes:
+            for flair in (False, True):
+                for long_notes in (False, True):
+                    pod, subscriber = build_podcast(size, flair=flair, long_notes=long_notes)
+                    episode = pod.get_all_episodes_raw().order_by('-publish').first()
+                    requests = _get_requests(pod, subscriber, episode)
+                    for view in views:
+                        cache.clear()
+                        for run_type in ('cold', 'warm'):
+                            result = measure(requests[view])
+                            result.update(
+                                view=view,
+                                episodes=size,
+                                flair=flair,
+                                long_notes=long_notes,
+                                run=run_type)
+                            results.append(result)
+                            if log:
+                                log(result)
+
+        transaction.set_rollback(True)
+
+    return results
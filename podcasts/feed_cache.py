@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min
+
+from pinecast.helpers import round_now
+
+
+FEED_VARIANT_PUBLIC = 'public'
+FEED_VARIANT_PRIVATE = 'private'
+
+
+def _version_key(podcast_id):
+    return 'feed:version:%s' % podcast_id
+
+def _body_key(podcast_id, variant, version):
+    return 'feed:body:%s:%s:%s' % (podcast_id, variant, version)
+
+
+def get_version(podcast_id):
+    key = _version_key(podcast_id)
+    version = cache.get(key)
+    if version is None:
+        # Seeding with the current time (rather than zero) means that if the
+        # version key gets evicted, we never land back on a version that has
+        # a stale body cached under it.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+def invalidate(podcast_id):
+    key = _version_key(podcast_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def get_feed(podcast, variant, version):
+    if not settings.CACHE_SHARED:
+        return None
+    cached = cache.get(_body_key(podcast.id, variant, version))
+    if cached is None:
+        return None
+
+    body, valid_until = cached
+    if valid_until is not None and valid_until <= datetime.datetime.now():
+        return None
+    return body
+
+def set_feed(podcast, variant, version, body, valid_until=None):
+    # The version is read by the caller before rendering so that a change
+    # which lands mid-render leaves the stale body under the old version.
+    if not settings.CACHE_SHARED:
+        return
+    timeout = settings.FEED_CACHE_TTL
+    if valid_until is not None:
+        remaining = (valid_until - datetime.datetime.now()).total_seconds()
+        timeout = max(1, min(timeout, int(remaining)))
+    cache.set(
+        _body_key(podcast.id, variant, version),
+        (body, valid_until),
+        timeout)
+
+
+def _subscriber_key(podcast_id, version, subscriber):
+    return 'feed:sub:%s:%s:%s' % (podcast_id, version, subscriber)
+
+def get_subscriber_access(podcast_id, version, subscriber):
+    """
+    Returns whether the subscriber may read the podcast's private feed, or
+    None if that isn't known. The feed version is part of the key so that
+    changes to the podcast (like its minimum subscription) are picked up.
+    """
+    if not settings.CACHE_SHARED:
+        return None
+    return cache.get(_subscriber_key(podcast_id, version, subscriber))
+
+def set_subscriber_access(podcast_id, version, subscriber, allowed):
+    if not settings.CACHE_SHARED:
+        return
+    cache.set(
+        _subscriber_key(podcast_id, version, subscriber),
+        allowed,
+        settings.FEED_SUBSCRIBER_CACHE_TTL)
+
+def invalidate_subscriber(podcast_id, subscriber):
+    cache.delete(_subscriber_key(podcast_id, get_version(podcast_id), subscriber))
+
+
+def _item_key(episode, stamp):
+    return 'feed:item:%s:%s' % (
+        episode.id,
+        hashlib.sha1(('%s,%s' % (episode.updated.isoformat(), stamp)).encode('utf-8')).hexdigest())
+
+def get_items(episodes, stamp):
+    """
+    Returns a dict mapping episode IDs to their cached feed item XML. `stamp`
+    identifies everything outside the episode row that goes into an item (the
+    owner's plan, available flair, etc.), while the episode's `updated`
+    timestamp covers its own content.
+    """
+    keys = {_item_key(ep, stamp): ep.id for ep in episodes}
+    return {keys[k]: v for k, v in cache.get_many(list(keys.keys())).items()}
+
+def set_items(items, stamp):
+    """`items` is a list of `(episode, item XML)` tuples."""
+    cache.set_many(
+        {_item_key(ep, stamp): item for ep, item in items},
+        settings.FEED_ITEM_CACHE_TTL)
+
+
+def get_feed_valid_until(podcast, oldest_publish=None, include_private=False):
+    """
+    Returns the time at which the set of episodes in a rendered feed will
+    change on its own, without anything being saved: either a scheduled
+    episode goes live, or the oldest episode (published at `oldest_publish`)
+    ages out of the public feed.
+    """
+    # Nothing is saved when a scheduled episode goes live; it just starts
+    # passing the `publish__lt` filter.
+    valid_until = (podcast.get_all_episodes_raw()
+        .filter(publish__gte=round_now(), awaiting_import=False)
+        .aggregate(Min('publish')))['publish__min']
+
+    if not include_private and podcast.private_after_age is not None and oldest_publish:
+        aged_out = oldest_publish + datetime.timedelta(seconds=podcast.private_after_age)
+        if valid_until is None or aged_out < valid_until:
+            valid_until = aged_out
+
+    return valid_until
+
+
+def _schedule_key(podcast_id, variant, version):
+    return 'feed:schedule:%s:%s:%s' % (podcast_id, variant, version)
+
+def get_max_age(podcast, variant, version, include_private=False):
+    """
+    Returns how long, in seconds, clients and CDNs may hold on to the feed.
+    Shows that publish rarely get longer lifetimes, which shrink as the time
+    the feed is due to change on its own approaches.
+    """
+    key = _schedule_key(podcast.id, variant, version)
+    now = datetime.datetime.now()
+    schedule = cache.get(key) if settings.CACHE_SHARED else None
+    if schedule is None or (schedule[1] is not None and schedule[1] <= now):
+        schedule = _get_schedule(podcast, include_private)
+        timeout = settings.FEED_CACHE_TTL
+        if schedule[1] is not None:
+            timeout = max(1, min(timeout, int((schedule[1] - now).total_seconds())))
+        if settings.CACHE_SHARED:
+            cache.set(key, schedule, timeout)
+
+    max_age, valid_until = schedule
+    if valid_until is not None:
+        max_age = min(max_age, max(1, int((valid_until - now).total_seconds())))
+    return max_age
+
+def _get_schedule(podcast, include_private):
+    visible = podcast.get_visible_episodes_raw(include_private)
+    publishes = list(
+        visible.order_by('-publish').values_list('publish', flat=True)[:settings.FEED_CADENCE_EPISODES])
+
+    # A day's worth of lifetime for every day between episodes, within limits
+    max_age = settings.FEED_MAX_AGE_MIN
+    if len(publishes) > 1:
+        gaps = sorted((a - b).total_seconds() for a, b in zip(publishes, publishes[1:]))
+        max_age = int(gaps[len(gaps) // 2] / 24)
+    max_age = min(max(max_age, settings.FEED_MAX_AGE_MIN), settings.FEED_MAX_AGE_MAX)
+
+    oldest_publish = None
+    if not include_private and podcast.private_after_age is not None:
+        oldest_publish = visible.aggregate(Min('publish'))['publish__min']
+
+    return max_age, get_feed_valid_until(podcast, oldest_publish, include_private)
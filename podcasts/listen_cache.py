@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pinecast.lru import LRUCache
+
+
+# Maps episodes to where `/listen` redirects them. Each process keeps the
+# hottest episodes in memory. Entries there can't be invalidated from other
+# processes, so they only live briefly; the shared cache tier, when enabled,
+# is invalidated directly.
+
+_local = LRUCache(settings.LISTEN_CACHE_SIZE, ttl=settings.LISTEN_CACHE_LOCAL_TTL)
+
+SOURCES = ('direct', 'embed')
+
+
+def _shared_key(episode_id, source):
+    return 'listen:%s:%s' % (episode_id, source)
+
+
+def get_target(episode_id, source):
+    target = _local.get((episode_id, source))
+    if target is not None or not settings.LISTEN_CACHE_SHARED_TTL:
+        return target
+
+    target = cache.get(_shared_key(episode_id, source))
+    if target is not None:
+        _local.set((episode_id, source), target)
+    return target
+
+def set_target(episode_id, source, target):
+    _local.set((episode_id, source), target)
+    if settings.LISTEN_CACHE_SHARED_TTL:
+        cache.set(_shared_key(episode_id, source), target, settings.LISTEN_CACHE_SHARED_TTL)
+
+def invalidate(episode_id):
+    for source in SOURCES:
+        _local.delete((episode_id, source))
+    if settings.LISTEN_CACHE_SHARED_TTL:
+        cache.delete_many([_shared_key(episode_id, source) for source in SOURCES])
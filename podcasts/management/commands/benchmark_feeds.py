@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from podcasts import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Measures the cost of rendering feeds, sites, and oEmbed for synthetic podcasts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes',
+            action='store',
+            dest='sizes',
+            default=','.join(str(x) for x in benchmarks.SIZES),
+            help='Comma-separated episode counts to benchmark')
+        parser.add_argument('--views',
+            action='store',
+            dest='views',
+            default=','.join(benchmarks.VIEWS),
+            help='Comma-separated views to benchmark')
+        parser.add_argument('--output',
+            action='store',
+            dest='output',
+            default='feed_benchmarks.json',
+            help='The path to write the JSON results to')
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options['sizes'].split(',')]
+        views = options['views'].split(',')
+        unknown = set(views) - set(benchmarks.VIEWS)
+        if unknown:
+            self.stderr.write('Unknown views: %s' % ', '.join(sorted(unknown)))
+            return
+        if not benchmarks.is_local_database():
+            self.stderr.write('Refusing to run benchmarks against a database that is not local')
+            return
+
+        def log(result):
+            self.stdout.write(
+                '%(view)s episodes=%(episodes)d flair=%(flair)s long_notes=%(long_notes)s %(run)s: '
+                '%(wall_ms).1fms, %(queries)d queries, %(peak_memory)d bytes peak' % result)
+
+        results = benchmarks.run(sizes=sizes, views=views, log=log)
+
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        self.stdout.write('Wrote %d results to %s' % (len(results), options['output']))
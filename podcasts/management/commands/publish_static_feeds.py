@@ -0,0 +1,31 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from podcasts import static_feeds
+from podcasts.models import Podcast
+
+
+class Command(BaseCommand):
+    help = ('Publishes static feeds for every podcast, or for the given slugs. '
+            'Feeds are otherwise published whenever they change.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*')
+
+    def handle(self, *args, **options):
+        if not settings.STATIC_FEEDS:
+            raise CommandError('Static feeds are not enabled')
+
+        pods = Podcast.objects.all()
+        if options['slugs']:
+            pods = pods.filter(slug__in=options['slugs'])
+
+        storage = static_feeds.get_storage()
+        count = 0
+        for pod in pods.select_related('owner').iterator():
+            static_feeds.publish(pod, storage)
+            count += 1
+            self.stdout.write(' - %s' % pod.slug)
+        self.stdout.write('Published %d feeds' % count)
@@ -0,0 +1,33 @@
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+
+from podcasts.models import FlairContext, Podcast
+from sites.models import SiteBlogPost, SitePage
+
+
+class Command(BaseCommand):
+    help = 'Backfills the stored HTML for episode descriptions and site content'
+
+    def handle(self, *args, **options):
+        ep_count = 0
+        for pod in Podcast.objects.all().select_related('owner').iterator():
+            flair = FlairContext(pod)
+            for ep in pod.get_all_episodes_raw().iterator():
+                setattr(ep, 'podcast', pod)
+                ep.get_html_description(flair=flair)
+                ep_count += 1
+            self.stdout.write(' - %s' % pod.slug)
+        self.stdout.write('Rendered %d episode descriptions' % ep_count)
+
+        post_count = 0
+        for post in SiteBlogPost.objects.all().iterator():
+            post.get_html_body()
+            post_count += 1
+        self.stdout.write('Rendered %d blog posts' % post_count)
+
+        page_count = 0
+        for page in SitePage.objects.filter(page_type='markdown').iterator():
+            page.get_html_body()
+            page_count += 1
+        self.stdout.write('Rendered %d site pages' % page_count)
@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pinecast.helpers import round_now
+from podcasts import scheduler
+
+
+class Command(BaseCommand):
+    help = ('Announces podcast content that changes with the passage of time, '
+            'like scheduled episodes going live')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookback',
+            action='store',
+            dest='lookback',
+            type=int,
+            default=15,
+            help='How many minutes back to look for changes on startup')
+        parser.add_argument('--interval',
+            action='store',
+            dest='interval',
+            type=int,
+            default=60,
+            help='The most seconds to wait between checks')
+        parser.add_argument('--once',
+            action='store_true',
+            dest='once',
+            default=False,
+            help='Checks for changes once and exits, for running from cron')
+
+    def handle(self, *args, **options):
+        since = round_now() - datetime.timedelta(minutes=options['lookback'])
+        while True:
+            close_old_connections()
+            until = round_now()
+            for pod_id in scheduler.emit_changes(since, until):
+                self.stdout.write('Changed: %s' % pod_id)
+            since = until
+
+            if options['once']:
+                break
+
+            # Wake up as soon as the next scheduled episode is visible. Checking
+            # at least every interval picks up newly scheduled episodes and
+            # episodes aging out.
+            wait = options['interval']
+            next_publish = scheduler.get_next_publish(until)
+            if next_publish is not None:
+                wait = min(wait, (next_publish - until).total_seconds() + 1)
+            time.sleep(max(wait, 1))
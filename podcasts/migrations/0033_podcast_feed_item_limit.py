@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.2 on 2017-04-09 21:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcasts', '0032_auto_20170402_1915'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='podcast',
+            name='feed_item_limit',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Episodes in the main feed; older episodes are on paged feeds', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.2 on 2017-04-23 18:12
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def clear_zero_limits(apps, schema_editor):
+    # A limit of zero served an empty feed; it now means no limit
+    Podcast = apps.get_model('podcasts', 'Podcast')
+    Podcast.objects.filter(feed_item_limit=0).update(feed_item_limit=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcasts', '0034_auto_20170416_2208'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_zero_limits, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='podcast',
+            name='feed_item_limit',
+            field=models.PositiveIntegerField(blank=True, default=None, help_text='Episodes in the main feed; older episodes are on paged feeds', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
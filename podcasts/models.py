@@ -5,18 +5,21 @@ import re
 import uuid
 from datetime import timedelta
 
-import gfm
 import requests
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.validators import URLValidator
+from django.core.validators import MinValueValidator, URLValidator
 from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils.translation import ugettext, ugettext_lazy
 
 import accounts.payment_plans as payment_plans
+from . import feed_cache, listen_cache, static_feeds
+from .signals import podcast_content_changed
 from accounts.models import Network, UserSettings
-from pinecast.helpers import cached_method, reverse, round_now, sanitize
+from pinecast.helpers import cached_method, get_rendered_markdown, reverse, round_now
 
 
 FLAIR_FEEDBACK = 'flair_feedback'
@@ -34,6 +37,11 @@ FLAIR_FLAGS = (
 FLAIR_FLAGS_MAP = {k: v for k, v in FLAIR_FLAGS}
 
 
+def _keyset_before(key):
+    publish, id_ = key
+    return models.Q(publish__lt=publish) | models.Q(publish=publish, id__lt=id_)
+
+
 class Podcast(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     slug = models.SlugField(unique=True)
@@ -42,6 +50,7 @@ class Podcast(models.Model):
     subtitle = models.CharField(max_length=512, default='', blank=True)
 
     created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False)
     cover_image = models.URLField(max_length=500)
     description = models.TextField(blank=True)
     is_explicit = models.BooleanField(default=False)
@@ -54,6 +63,9 @@ class Podcast(models.Model):
     owner = models.ForeignKey(User)
 
     rss_redirect = models.URLField(null=True, blank=True, max_length=500)
+    feed_item_limit = models.PositiveIntegerField(
+        default=None, null=True, blank=True, validators=[MinValueValidator(1)],
+        help_text=ugettext_lazy('Episodes in the main feed; older episodes are on paged feeds'))
     stats_base_listens = models.PositiveIntegerField(default=0)
 
     networks = models.ManyToManyField(Network, blank=True)
@@ -110,24 +122,55 @@ class Podcast(models.Model):
     def get_all_episodes_raw(self):
         return PodcastEpisode.objects.filter(podcast=self)
 
-    @cached_method
-    def get_episodes(self, select_related=None, include_private=False):
-        episodes = self.get_all_episodes_raw().filter(
-            publish__lt=round_now(),
-            awaiting_import=False).order_by('-publish')
+    def get_visible_episodes_q(self, include_private=False):
+        visible = models.Q(publish__lt=round_now(), awaiting_import=False)
         if not include_private:
-            episodes = episodes.filter(is_private=False)
+            visible &= models.Q(is_private=False)
             if self.private_after_age is not None:
                 max_age = round_now() - timedelta(seconds=self.private_after_age)
-                episodes = episodes.filter(publish__gt=max_age)
-            if self.private_after_nth is not None:
-                episodes = episodes[:self.private_after_nth]
+                visible &= models.Q(publish__gt=max_age)
+        return visible
+
+    def get_visible_episodes_raw(self, include_private=False):
+        return self.get_all_episodes_raw().filter(
+            self.get_visible_episodes_q(include_private))
+
+    def get_episode_limit(self, include_private=False):
+        limits = []
+        if not include_private and self.private_after_nth is not None:
+            limits.append(self.private_after_nth)
+        if UserSettings.get_from_user(self.owner).plan == payment_plans.PLAN_DEMO:
+            limits.append(10)
+        return min(limits) if limits else None
+
+    def _get_feed_episodes_raw(self, include_private=False, before=None):
+        """
+        Returns the visible episodes newest-first, starting after the
+        `(publish, id)` key `before` if it's set, along with the maximum number
+        of them that may be shown (or None).
+        """
+        episodes = self.get_visible_episodes_raw(include_private).order_by('-publish', '-id')
+        max_count = self.get_episode_limit(include_private)
+        if before is None:
+            return episodes, max_count
+
+        if max_count is not None:
+            # Deeper pages can't reach past the Nth episode overall
+            oldest = list(episodes.values_list('publish', 'id')[max_count - 1:max_count])
+            if oldest:
+                episodes = episodes.exclude(_keyset_before(oldest[0]))
+        return episodes.filter(_keyset_before(before)), None
+
+    @cached_method
+    def get_episodes(self, select_related=None, include_private=False, limit=None, before=None):
+        episodes, max_count = self._get_feed_episodes_raw(include_private, before)
 
         if select_related:
             episodes = episodes.select_related(select_related)
-        us = UserSettings.get_from_user(self.owner)
-        if us.plan == payment_plans.PLAN_DEMO:
-            episodes = episodes[:10]
+        if max_count is not None:
+            episodes = episodes[:max_count]
+        if limit is not None:
+            episodes = episodes[:limit]
 
         # This is a clever little optimization to prevent `episode.podcast`
         # from doing a db query, and avoiding needing to `select_related('podcast')`,
@@ -136,6 +179,52 @@ class Podcast(models.Model):
             setattr(ep, 'podcast', self)
         return episodes
 
+    def iter_episodes(self, include_private=False, chunk_size=100, limit=None, before=None,
+                      select_related=None):
+        """
+        Yields the same episodes as `get_episodes()`, but reads them from the
+        database `chunk_size` rows at a time so that only one chunk is ever
+        held in memory.
+        """
+        episodes, remaining = self._get_feed_episodes_raw(include_private, before)
+        if select_related:
+            episodes = episodes.select_related(select_related)
+        if limit is not None:
+            remaining = limit if remaining is None else min(limit, remaining)
+
+        last = None
+        while remaining is None or remaining > 0:
+            chunk = episodes
+            if last is not None:
+                # Keyset pagination, so deep chunks don't pay for an OFFSET
+                chunk = chunk.filter(_keyset_before((last.publish, last.id)))
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+
+            count = 0
+            for ep in chunk[:size].iterator():
+                setattr(ep, 'podcast', self)
+                count += 1
+                last = ep
+                yield ep
+
+            if remaining is not None:
+                remaining -= count
+            if count < size:
+                return
+
+    def get_feed_page_end(self, limit, include_private=False, before=None):
+        """
+        Returns the `(publish, id)` key of the last episode on a feed page of
+        `limit` episodes, or None if there are no episodes after that page.
+        """
+        episodes, max_count = self._get_feed_episodes_raw(include_private, before)
+        if max_count is not None and max_count <= limit:
+            return None
+        if max_count is not None:
+            episodes = episodes[:max_count]
+        keys = list(episodes.values_list('publish', 'id')[limit - 1:limit + 1])
+        return keys[0] if len(keys) == 2 else None
+
     @cached_method
     def has_private_episodes(self):
         rn = round_now()
@@ -247,12 +336,41 @@ class Podcast(models.Model):
         return 0 if remaining < 0 else remaining
 
 
+class FlairContext(object):
+    """
+    Everything about a podcast's owner and site that episode flair depends
+    on. Build one per request and pass it to `get_html_description()` so that
+    rendering many episodes doesn't look these up again for each one.
+    """
+
+    def __init__(self, podcast, is_demo=None):
+        us = UserSettings.get_from_user(podcast.owner)
+        self.podcast = podcast
+        self.plan = us.plan
+        self.is_demo = us.plan == payment_plans.PLAN_DEMO if is_demo is None else is_demo
+        self.coupon_code = us.coupon_code
+        self.available_flags = podcast.get_available_flair_flags(flatten=True)
+
+        self.site_url = None
+        if FLAIR_SITE_LINK in self.available_flags:
+            self.site_url = podcast.get_site().get_domain()
+
+        self.tip_jar_url = 'https://pinecast.com/payments/tips/%s' % podcast.slug
+
+    def get_feedback_url(self, episode):
+        return 'https://pinecast.com%s' % reverse(
+            'ep_comment_box',
+            podcast_slug=self.podcast.slug,
+            episode_id=str(episode.id))
+
+
 class PodcastEpisode(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     podcast = models.ForeignKey(Podcast)
     title = models.CharField(max_length=1024)
     subtitle = models.CharField(max_length=1024, default='', blank=True)
     created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False)
     publish = models.DateTimeField(db_index=True)
     description = models.TextField(default='')
     duration = models.PositiveIntegerField(
@@ -290,6 +408,12 @@ class PodcastEpisode(models.Model):
 
     stats_base_listens = models.PositiveIntegerField(default=0)
 
+    # The rendered and sanitized description, including flair. See
+    # `get_html_description()`.
+    description_html = models.TextField(default='', blank=True, editable=False)
+    description_html_source_hash = models.CharField(
+        max_length=40, default='', blank=True, editable=False)
+
     # This is just an override. Use check_is_private() to determine if it is
     # private because of podcast-level settings.
     is_private = models.BooleanField(
@@ -336,32 +460,39 @@ class PodcastEpisode(models.Model):
         if not no_save:
             self.save()
 
-    def get_html_description(self, is_demo=None):
+    def save(self, *args, **kwargs):
+        # Render the description up front so that reads don't have to
+        self.get_html_description(persist=False)
+        super(PodcastEpisode, self).save(*args, **kwargs)
+
+    def get_html_description(self, is_demo=None, persist=True, flair=None):
+        return get_rendered_markdown(
+            self,
+            self.get_markdown_description(is_demo, flair),
+            'description_html',
+            persist=persist)
+
+    def get_markdown_description(self, is_demo=None, flair=None):
+        if flair is None:
+            flair = FlairContext(self.podcast, is_demo)
         raw = self.description
-        us = UserSettings.get_from_user(self.podcast.owner)
-        if is_demo is None:
-            is_demo = us.plan == payment_plans.PLAN_DEMO
-        available_flags = self.podcast.get_available_flair_flags(flatten=True)
+        available_flags = flair.available_flags
 
         if (self.flair_tip_jar and
             FLAIR_TIP_JAR in available_flags):
-            raw += '\n\nSupport %s by donating to the [tip jar](https://pinecast.com/payments/tips/%s).' % (
-                self.podcast.name, self.podcast.slug)
+            raw += '\n\nSupport %s by donating to the [tip jar](%s).' % (
+                self.podcast.name, flair.tip_jar_url)
 
         if self.flair_site_link and FLAIR_SITE_LINK in available_flags:
-            site_url = self.podcast.get_site().get_domain()
-            raw += '\n\nFind out more at [%s](%s).' % (self.podcast.name, site_url)
+            raw += '\n\nFind out more at [%s](%s).' % (self.podcast.name, flair.site_url)
 
         if (self.flair_feedback and
             FLAIR_FEEDBACK in available_flags):
             prompt = self.get_feedback_prompt()
-            fb_url = 'https://pinecast.com%s' % reverse(
-                'ep_comment_box',
-                podcast_slug=self.podcast.slug,
-                episode_id=str(self.id))
+            fb_url = flair.get_feedback_url(self)
             raw += '\n\n%s [%s](%s)' % (prompt, fb_url, fb_url)
 
-        has_powered_by = is_demo or self.flair_powered_by and FLAIR_POWERED_BY in available_flags
+        has_powered_by = flair.is_demo or self.flair_powered_by and FLAIR_POWERED_BY in available_flags
         if has_powered_by:
             raw += ('\n\nThis podcast is powered by '
                     '[Pinecast](https://pinecast.com).')
@@ -378,13 +509,12 @@ class PodcastEpisode(models.Model):
             raw += (
                 'If you decide to upgrade, use coupon code **%s** for %d%% off '
                 'for %d months, and support %s.') % (
-                    us.coupon_code,
+                    flair.coupon_code,
                     settings.REFERRAL_DISCOUNT,
                     settings.REFERRAL_DISCOUNT_DURATION,
                     self.podcast.name)
 
-        markdown = gfm.markdown(raw)
-        return sanitize(markdown)
+        return raw
 
     def get_feedback_prompt(self, default=None):
         try:
@@ -526,3 +656,75 @@ class PodcastCategory(models.Model):
 
     def __str__(self):
         return '%s: %s' % (self.podcast.name, self.category)
+
+
+# Rendered feeds are cached until something they're built from changes. The
+# podcast's `updated` timestamp is bumped for the same reasons, since it backs
+# the feed's Last-Modified header.
+
+def _feed_changed(pod_id):
+    feed_cache.invalidate(pod_id)
+    static_feeds.schedule_publish(pod_id)
+
+def _podcasts_changed(pod_ids):
+    pod_ids = list(pod_ids)
+    Podcast.objects.filter(id__in=pod_ids).update(updated=datetime.datetime.now())
+    for pod_id in pod_ids:
+        _feed_changed(pod_id)
+
+@receiver(podcast_content_changed)
+def _invalidate_feed_scheduled(sender, podcast_id, **kwargs):
+    _podcasts_changed([podcast_id])
+
+@receiver(post_save, sender=Podcast)
+def _invalidate_feed_podcast(sender, instance, **kwargs):
+    _feed_changed(instance.id)
+
+@receiver(pre_save, sender=Podcast)
+def _unpublish_renamed_podcast(sender, instance, **kwargs):
+    # The static feed lives at a key built from the slug, so the feed at the
+    # old slug would otherwise be left up, going stale
+    if not settings.STATIC_FEEDS or instance.id is None:
+        return
+    old_slug = Podcast.objects.filter(id=instance.id).values_list('slug', flat=True).first()
+    if old_slug is not None and old_slug != instance.slug:
+        static_feeds.schedule_unpublish(old_slug)
+
+@receiver(post_delete, sender=Podcast)
+def _invalidate_feed_podcast_deleted(sender, instance, **kwargs):
+    feed_cache.invalidate(instance.id)
+    static_feeds.schedule_unpublish(instance.slug)
+
+@receiver(post_save, sender=PodcastEpisode)
+def _invalidate_feed_episode(sender, instance, **kwargs):
+    # The episode's own `updated` timestamp covers this one. Leaving the
+    # podcast alone keeps the other episodes' cached feed items valid.
+    _feed_changed(instance.podcast_id)
+
+@receiver(post_delete, sender=PodcastEpisode)
+@receiver([post_save, post_delete], sender=PodcastCategory)
+@receiver([post_save, post_delete], sender='sites.Site')
+def _invalidate_feed_podcast_child(sender, instance, **kwargs):
+    _podcasts_changed([instance.podcast_id])
+
+@receiver([post_save, post_delete], sender='feedback.EpisodeFeedbackPrompt')
+def _invalidate_feed_feedback_prompt(sender, instance, **kwargs):
+    # The prompt is embedded in the episode description flair, so this counts
+    # as a change to the episode.
+    episodes = PodcastEpisode.objects.filter(id=instance.episode_id)
+    episodes.update(updated=datetime.datetime.now())
+    for pod_id in episodes.values_list('podcast_id', flat=True):
+        _feed_changed(pod_id)
+
+@receiver(post_save, sender=UserSettings)
+def _invalidate_feed_user_settings(sender, instance, **kwargs):
+    # The plan, coupon code, and payout account all affect feed content
+    _podcasts_changed(Podcast.objects
+        .filter(owner_id=instance.user_id)
+        .values_list('id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=PodcastEpisode)
+def _invalidate_listen_target(sender, instance, **kwargs):
+    # The redirect target is built from the audio URL
+    listen_cache.invalidate(str(instance.id))
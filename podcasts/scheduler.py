@@ -0,0 +1,62 @@
+from __future__ import absolute_import
+
+import datetime
+
+from django.db.models import Min, Q
+
+from .models import Podcast, PodcastEpisode
+from .signals import podcast_content_changed
+
+
+# Episodes become visible (and, on public feeds, age out) purely by the passage
+# of time. The scheduler watches for those moments and announces them with
+# `podcast_content_changed`, so caches of podcast content can be held until
+# something actually changes.
+
+
+def get_changed_podcast_ids(since, until):
+    """
+    Returns the IDs of podcasts whose visible episodes changed on their own
+    between `since` (inclusive) and `until` (exclusive).
+    """
+    # Scheduled episodes that have gone live
+    pod_ids = set(PodcastEpisode.objects
+        .filter(publish__gte=since, publish__lt=until, awaiting_import=False)
+        .values_list('podcast_id', flat=True)
+        .distinct())
+
+    # Episodes that have aged out of the public feed. Podcasts tend to share
+    # a handful of ages, so this is one query for the episodes of every
+    # podcast, whatever number of podcasts set an age.
+    ages = (Podcast.objects
+        .filter(private_after_age__isnull=False)
+        .values_list('private_after_age', flat=True)
+        .distinct())
+    aged_out = Q()
+    for max_age in ages:
+        age = datetime.timedelta(seconds=max_age)
+        aged_out |= Q(
+            podcast__private_after_age=max_age,
+            publish__gte=since - age,
+            publish__lt=until - age)
+    if aged_out:
+        pod_ids.update(PodcastEpisode.objects
+            .filter(aged_out)
+            .values_list('podcast_id', flat=True)
+            .distinct())
+
+    return pod_ids
+
+
+def get_next_publish(after):
+    """Returns when the next scheduled episode goes live, if one is scheduled."""
+    return (PodcastEpisode.objects
+        .filter(publish__gte=after, awaiting_import=False)
+        .aggregate(Min('publish')))['publish__min']
+
+
+def emit_changes(since, until):
+    pod_ids = get_changed_podcast_ids(since, until)
+    for pod_id in pod_ids:
+        podcast_content_changed.send(sender=Podcast, podcast_id=pod_id)
+    return pod_ids
@@ -0,0 +1,8 @@
+from __future__ import absolute_import
+
+from django.dispatch import Signal
+
+
+# Sent when what a podcast shows changes without anything being saved, like
+# when a scheduled episode goes live. See `podcasts.scheduler`.
+podcast_content_changed = Signal(providing_args=['podcast_id'])
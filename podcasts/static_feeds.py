@@ -0,0 +1,213 @@
+from __future__ import absolute_import
+
+import atexit
+import gzip
+import os
+import sys
+import threading
+import time
+
+import brotli
+import rollbar
+from boto3.session import Session
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import feed_cache
+from pinecast.helpers import reverse
+
+
+# Each feed is stored uncompressed and pre-compressed, so the CDN can pick the
+# object matching the client's Accept-Encoding without compressing anything.
+ENCODINGS = (
+    (None, '', lambda body: body),
+    ('gzip', '.gz', gzip.compress),
+    ('br', '.br', brotli.compress),
+)
+
+
+def get_feed_key(podcast_slug):
+    # Objects are keyed by the feed's path, so the CDN can map requests for
+    # the feed straight onto the bucket.
+    return reverse('feed', podcast_slug=podcast_slug).lstrip('/')
+
+
+class S3FeedStorage(object):
+    def __init__(self, bucket):
+        session = Session(aws_access_key_id=settings.S3_ACCESS_ID,
+                          aws_secret_access_key=settings.S3_SECRET_KEY)
+        self.client = session.client('s3')
+        self.bucket = bucket
+
+    def write(self, key, body, content_encoding=None, cache_control=None):
+        extra = {'ContentEncoding': content_encoding} if content_encoding else {}
+        if cache_control:
+            extra['CacheControl'] = cache_control
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType='application/rss+xml',
+            **extra)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+class LocalFeedStorage(object):
+    def __init__(self, root):
+        self.root = root
+
+    def write(self, key, body, content_encoding=None, cache_control=None):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body)
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+def get_storage():
+    if settings.STATIC_FEEDS_DIR:
+        return LocalFeedStorage(settings.STATIC_FEEDS_DIR)
+    return S3FeedStorage(settings.STATIC_FEEDS_BUCKET)
+
+
+def publish(pod, storage=None):
+    """Writes the podcast's main public feed, in every encoding, to storage."""
+    storage = storage or get_storage()
+    if pod.rss_redirect:
+        # Redirects are answered by the app
+        unpublish(pod.slug, storage)
+        return
+
+    from .views import get_cache_control, render_feed
+    body = render_feed(pod).encode('utf-8')
+    cache_control = get_cache_control(
+        pod, feed_cache.FEED_VARIANT_PUBLIC, feed_cache.get_version(pod.id))
+    key = get_feed_key(pod.slug)
+    for encoding, suffix, compress in ENCODINGS:
+        storage.write(key + suffix, compress(body), encoding, cache_control)
+
+def unpublish(podcast_slug, storage=None):
+    storage = storage or get_storage()
+    key = get_feed_key(podcast_slug)
+    for _, suffix, _ in ENCODINGS:
+        storage.delete(key + suffix)
+
+
+# Saves come in bursts (an import saves every episode, and editing a podcast
+# saves its categories too), and publishing renders the whole feed. Podcasts
+# are collected as their changes commit, and a background thread in each
+# process publishes each of them once the burst is over.
+
+_pending = set()
+_pending_lock = threading.Lock()
+_wake = threading.Event()
+_publisher_lock = threading.Lock()
+_publisher_pid = None
+
+
+def schedule_publish(pod_id):
+    """
+    Queues the podcast's static feed to be republished once the current
+    transaction commits, so the feed never reflects changes that get rolled
+    back.
+    """
+    if not settings.STATIC_FEEDS:
+        return
+
+    def run():
+        _ensure_publisher()
+        with _pending_lock:
+            _pending.add(pod_id)
+        _wake.set()
+
+    transaction.on_commit(run)
+
+
+def publish_pending(storage=None):
+    """
+    Publishes every podcast that's waiting to be published. Failures are
+    reported rather than raised, since the changes themselves have already
+    been saved. Returns the number of podcasts.
+    """
+    with _pending_lock:
+        pod_ids = list(_pending)
+        _pending.clear()
+    if not pod_ids:
+        return 0
+
+    from .models import Podcast
+    try:
+        storage = storage or get_storage()
+        pods = list(Podcast.objects.filter(id__in=pod_ids).select_related('owner'))
+    except Exception:
+        # Try them again next time
+        with _pending_lock:
+            _pending.update(pod_ids)
+        raise
+
+    for pod in pods:
+        try:
+            publish(pod, storage)
+        except Exception:
+            rollbar.report_exc_info(sys.exc_info())
+    return len(pod_ids)
+
+
+def _ensure_publisher():
+    global _publisher_pid
+    pid = os.getpid()
+    if _publisher_pid == pid:
+        return
+
+    with _publisher_lock:
+        # Threads don't survive a fork, so each worker process starts its own
+        if _publisher_pid == pid:
+            return
+        thread = threading.Thread(target=_run_publisher, name='static-feed-publisher', daemon=True)
+        thread.start()
+        atexit.register(_publish_at_exit)
+        _publisher_pid = pid
+
+
+def _publish_at_exit():
+    try:
+        publish_pending()
+    except Exception:
+        rollbar.report_exc_info(sys.exc_info())
+
+
+def _run_publisher():
+    storage = None
+    while True:
+        _wake.wait()
+        time.sleep(settings.STATIC_FEEDS_PUBLISH_DELAY)
+        _wake.clear()
+
+        close_old_connections()
+        try:
+            # One client for the life of the thread
+            storage = storage or get_storage()
+            publish_pending(storage)
+        except Exception:
+            rollbar.report_exc_info(sys.exc_info())
+            _wake.set()
+
+
+def schedule_unpublish(podcast_slug):
+    if not settings.STATIC_FEEDS:
+        return
+
+    def run():
+        try:
+            unpublish(podcast_slug)
+        except Exception:
+            rollbar.report_exc_info(sys.exc_info())
+
+    transaction.on_commit(run)
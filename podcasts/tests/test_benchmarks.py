@@ -0,0 +1,25 @@
+from __future__ import absolute_import
+
+from django.test import TestCase
+from nose.tools import eq_
+
+from .. import benchmarks
+
+
+class FeedBenchmarkTest(TestCase):
+
+    def test_feed_benchmarks(self):
+        results = benchmarks.run(sizes=[10])
+
+        # Every view, for each flair/notes combination, cold and warm
+        eq_(len(results), len(benchmarks.VIEWS) * 4 * 2)
+        for result in results:
+            eq_(result['status'], 200)
+            assert result['response_bytes'] > 0
+            assert result['wall_ms'] > 0
+
+    def test_feed_query_count_is_constant(self):
+        small = benchmarks.run(sizes=[10], views=['feed'])
+        large = benchmarks.run(sizes=[100], views=['feed'])
+        for s, l in zip(small, large):
+            eq_(s['queries'], l['queries'])
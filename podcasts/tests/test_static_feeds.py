@@ -0,0 +1,66 @@
+from __future__ import absolute_import
+
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import brotli
+from django.test import TestCase, override_settings
+from nose.tools import eq_
+
+from .. import static_feeds
+from ..benchmarks import build_podcast
+
+
+class StaticFeedTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.storage = static_feeds.LocalFeedStorage(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read(self, pod, suffix=''):
+        path = os.path.join(self.root, static_feeds.get_feed_key(pod.slug) + suffix)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_publish(self):
+        pod, _ = build_podcast(3)
+        static_feeds.publish(pod, self.storage)
+
+        body = self.read(pod)
+        assert b'<title>Episode 0</title>' in body
+        eq_(gzip.decompress(self.read(pod, '.gz')), body)
+        eq_(brotli.decompress(self.read(pod, '.br')), body)
+
+    def test_unpublish(self):
+        pod, _ = build_podcast(1)
+        static_feeds.publish(pod, self.storage)
+        static_feeds.unpublish(pod.slug, self.storage)
+        for _, suffix, _ in static_feeds.ENCODINGS:
+            assert not os.path.exists(
+                os.path.join(self.root, static_feeds.get_feed_key(pod.slug) + suffix))
+
+    def test_publish_pending(self):
+        pod, _ = build_podcast(2)
+        static_feeds._pending.update([pod.id, pod.id])
+        eq_(static_feeds.publish_pending(self.storage), 1)
+        assert b'<title>Episode 0</title>' in self.read(pod)
+        eq_(static_feeds.publish_pending(self.storage), 0)
+
+    @override_settings(STATIC_FEEDS=True)
+    def test_slug_change_unpublishes_old_feed(self):
+        pod, _ = build_podcast(1)
+        old_slug = pod.slug
+        with mock.patch.object(static_feeds, 'schedule_unpublish') as schedule_unpublish, \
+                mock.patch.object(static_feeds, 'schedule_publish'):
+            pod.save()
+            eq_(schedule_unpublish.call_count, 0)
+
+            pod.slug = old_slug + '-renamed'
+            pod.save()
+            schedule_unpublish.assert_called_once_with(old_slug)
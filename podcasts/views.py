@@ -1,19 +1,28 @@
 from __future__ import absolute_import
 
+import datetime
+import hashlib
+import itertools
 import time
+import uuid
 from email.utils import formatdate
 from xml.sax.saxutils import escape, quoteattr
 
 from django.conf import settings
-from django.http import Http404, HttpResponse
+from django.db.models import Case, Count, F, Max, When
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.utils.http import http_date, parse_http_date_safe
 
 import accounts.payment_plans as plans
-import analytics.log as analytics_log
-from .models import Podcast, PodcastEpisode
+import analytics.subscriptions as analytics_subscriptions
+from . import feed_cache, listen_cache
+from .models import FlairContext, Podcast, PodcastEpisode
 from accounts.models import UserSettings
 from payments.models import RecurringTip
-from pinecast.helpers import get_object_or_404
+from pinecast.coalesce import coalesce
+from pinecast.helpers import get_object_or_404, reverse
+from pinecast.types import StringTypes
 
 
 PREMIUM_S3_PREFIX = 'https://%s.s3.amazonaws.com/' % settings.S3_PREMIUM_BUCKET
@@ -25,63 +34,235 @@ def _asset(url):
 
 
 def listen(req, episode_id):
-    ep = get_object_or_404(PodcastEpisode, id=episode_id)
-    return redirect(
-        _asset(ep.get_url('embed' if req.GET.get('embed') else 'direct'))
-    )
+    source = 'embed' if req.GET.get('embed') else 'direct'
+    try:
+        # Normalized, so every spelling of the ID shares a cache entry
+        episode_id = str(uuid.UUID(episode_id))
+    except ValueError:
+        raise Http404()
+
+    target = listen_cache.get_target(episode_id, source)
+    if target is None:
+        ep = get_object_or_404(PodcastEpisode, id=episode_id)
+        target = _asset(ep.get_url(source))
+        listen_cache.set_target(episode_id, source, target)
+    return redirect(target)
 
 
 def feed(req, podcast_slug):
     pod = get_object_or_404(Podcast, slug=podcast_slug)
-    episodes = pod.get_episodes()
-    return _gen_feed(req, pod, episodes)
+    return _gen_feed(
+        req, pod,
+        'https://pinecast.com%s' % reverse('feed', podcast_slug=pod.slug))
 
 def feed_private(req, podcast_slug, subscriber):
     pod = get_object_or_404(Podcast, slug=podcast_slug)
-    recurring_tip = get_object_or_404(RecurringTip, podcast=pod, tipper__uuid=subscriber, deactivated=False)
-    setattr(recurring_tip, 'podcast', pod)  # ✨magic optimization ✨
-    if not recurring_tip.eligible_to_access_private():
+
+    # Every subscriber is served the same cached body, so the only work done
+    # per subscriber is checking that they're still eligible.
+    version = feed_cache.get_version(pod.id)
+    allowed = feed_cache.get_subscriber_access(pod.id, version, subscriber)
+    if allowed is None:
+        try:
+            recurring_tip = get_object_or_404(
+                RecurringTip, podcast=pod, tipper__uuid=subscriber, deactivated=False)
+        except Http404:
+            allowed = False
+        else:
+            setattr(recurring_tip, 'podcast', pod)  # ✨magic optimization ✨
+            allowed = recurring_tip.eligible_to_access_private()
+        feed_cache.set_subscriber_access(pod.id, version, subscriber, allowed)
+
+    if not allowed:
         raise Http404()
-    episodes = pod.get_episodes(include_private=True)
-    return _gen_feed(req, pod, episodes)
+    return _gen_feed(
+        req, pod,
+        'https://pinecast.com%s' % reverse('feed_private', podcast_slug=pod.slug, subscriber=subscriber),
+        include_private=True)
 
 
-def _gen_feed(req, pod, episodes):
-    items = []
-    is_demo = UserSettings.get_from_user(pod.owner).plan == plans.PLAN_DEMO
+# Cached feed bodies are shared by every subscriber of the private feed, so
+# links back to the feed itself are filled in when the body is served.
+FEED_URL_PLACEHOLDER = '{pinecast:feed_url}'
 
-    channel_explicit_tag = '<itunes:explicit>%s</itunes:explicit>' % ('yes' if pod.is_explicit else 'no')
+def _parse_page_key(raw):
+    try:
+        publish, id_ = raw.split('_', 1)
+        return datetime.datetime.strptime(publish, '%Y%m%d%H%M%S%f'), uuid.UUID(id_)
+    except ValueError:
+        raise Http404()
+
+def _format_page_key(key):
+    return '%s_%s' % (key[0].strftime('%Y%m%d%H%M%S%f'), key[1])
+
+
+def _gen_feed(req, pod, feed_url, include_private=False):
+    variant = (feed_cache.FEED_VARIANT_PRIVATE if include_private else
+               feed_cache.FEED_VARIANT_PUBLIC)
+
+    # Paged feeds (RFC 5005): the main feed holds the newest
+    # `feed_item_limit` episodes, and each page links to the next one.
+    page_size = pod.feed_item_limit
+    before = None
+    if req.GET.get('before'):
+        if not page_size:
+            raise Http404()
+        before = _parse_page_key(req.GET.get('before'))
+        variant += ':' + _format_page_key(before)
+
+    # Queue the log of this for the analytics back-end(s). Public feeds served
+    # statically are counted from the CDN's logs instead, which include the
+    # requests that reach us.
+    if include_private or not settings.STATIC_FEEDS:
+        analytics_subscriptions.log_subscription(req, pod)
+
+    etag, last_modified, episode_count = _get_feed_validators(pod, variant, include_private)
+    version = feed_cache.get_version(pod.id)
+    status = 200 if not pod.rss_redirect else 301
+    if not pod.rss_redirect and _is_not_modified(req, etag, last_modified):
+        resp = HttpResponseNotModified()
+    else:
+        body = feed_cache.get_feed(pod, variant, version)
+        if body is None and req.method == 'HEAD':
+            # The body would be discarded anyway, so don't render it. It's sent
+            # as an empty stream, since an empty string would be answered with
+            # a Content-Length of 0 rather than the length of the feed.
+            body = iter(())
+        elif body is None and _should_stream(pod, episode_count, include_private):
+            # Big back catalogs are streamed instead of being rendered into
+            # memory, so memory use stays flat however many episodes there
+            # are. The whole body isn't cached, since that would mean
+            # buffering it anyway; its items are, so re-rendering it is mostly
+            # a matter of reading them back.
+            body = _iter_feed(
+                pod,
+                pod.iter_episodes(
+                    include_private=include_private, limit=page_size, before=before,
+                    select_related='episodefeedbackprompt'),
+                feed_url,
+                before=before,
+                page_end=_get_page_end(pod, include_private, before))
+        elif body is None:
+            # When a feed changes, its subscribers all come asking at once.
+            # Only one of them renders it; the rest wait for that copy.
+            def render():
+                episodes = pod.get_episodes(
+                    include_private=include_private, limit=page_size, before=before,
+                    select_related='episodefeedbackprompt')
+                body = _render_feed(
+                    pod, episodes,
+                    before=before,
+                    page_end=_get_page_end(pod, include_private, before))
+                feed_cache.set_feed(
+                    pod, variant, version, body,
+                    feed_cache.get_feed_valid_until(
+                        pod, episodes[len(episodes) - 1].publish if episodes else None, include_private))
+                return body
 
-    for ep in episodes:
-        ep_url = _asset(ep.get_url('rss'))
+            body = coalesce('feed:%s:%s:%s' % (pod.id, variant, version), render)
 
-        md_desc = ep.get_html_description(is_demo=is_demo)
+        if isinstance(body, StringTypes) and page_size:
+            body = body.replace(FEED_URL_PLACEHOLDER, escape(feed_url))
 
-        explicit_tag = ''
-        if ep.explicit_override != PodcastEpisode.EXPLICIT_OVERRIDE_CHOICE_NONE:
-            explicit_tag = '<itunes:explicit>%s</itunes:explicit>' % (
-                'yes' if ep.explicit_override == PodcastEpisode.EXPLICIT_OVERRIDE_CHOICE_EXPLICIT else 'clean')
+        if isinstance(body, StringTypes):
+            resp = HttpResponse(body, content_type='application/rss+xml', status=status)
         else:
-            explicit_tag = channel_explicit_tag
-
-        items.append('\n'.join([
-            '<item>',
-            '<title>%s</title>' % escape(ep.title),
-            '<description><![CDATA[%s]]></description>' % md_desc,
-            '<link>%s</link>' % escape(ep_url),
-            '<guid isPermaLink="false">https://pinecast.com/guid/%s</guid>' % escape(str(ep.id)),
-            '<pubDate>%s</pubDate>' % formatdate(time.mktime(ep.publish.timetuple())),
-            explicit_tag,
-            '<itunes:author>%s</itunes:author>' % escape(pod.author_name),
-            '<itunes:subtitle>%s</itunes:subtitle>' % escape(ep.subtitle),
-            '<itunes:image href=%s />' % quoteattr(_asset(ep.image_url)),
-            '<itunes:duration>%s</itunes:duration>' % escape(ep.formatted_duration()),
-            '<enclosure url=%s length=%s type=%s />' % (
-                quoteattr(ep_url), quoteattr(str(ep.audio_size)), quoteattr(ep.audio_type)),
-            ('<dc:copyright>%s</dc:copyright>' % escape(ep.copyright)) if ep.copyright else '',
-            ('<dc:rights>%s</dc:rights>' % escape(ep.license)) if ep.license else '',
-            '</item>',
-        ]))
+            resp = StreamingHttpResponse(body, content_type='application/rss+xml', status=status)
+        if pod.rss_redirect:
+            resp.setdefault('Location', pod.rss_redirect)
+
+    resp['ETag'] = etag
+    resp['Last-Modified'] = http_date(last_modified)
+    resp.setdefault('Cache-Control', get_cache_control(pod, variant, version, include_private))
+    resp.setdefault('Access-Control-Allow-Origin', '*')
+    resp.setdefault('Access-Control-Request-Method', 'GET')
+
+    return resp
+
+
+def get_cache_control(pod, variant, version, include_private=False):
+    max_age = feed_cache.get_max_age(pod, variant, version, include_private)
+    if include_private:
+        # Subscriber feeds mustn't be held by shared caches, or for long, so
+        # that losing access takes effect quickly
+        return 'private, max-age=%d' % min(max_age, settings.FEED_MAX_AGE_MIN)
+    return 'public, max-age=%d, stale-while-revalidate=%d' % (max_age, max_age)
+
+
+def _should_stream(pod, episode_count, include_private):
+    for limit in (pod.get_episode_limit(include_private), pod.feed_item_limit):
+        if limit:
+            episode_count = min(episode_count, limit)
+    return episode_count >= settings.FEED_STREAMING_MIN_EPISODES
+
+
+def _get_page_end(pod, include_private, before):
+    if not pod.feed_item_limit:
+        return None
+    return pod.get_feed_page_end(pod.feed_item_limit, include_private, before)
+
+
+def _get_feed_validators(pod, variant, include_private):
+    # Edits bump `updated` on the episode (and on the podcast, for deletions
+    # and other related changes), while scheduled episodes going live and old
+    # episodes aging out of the public feed show up in the newest `publish`
+    # and the episode count. `updated` is taken over every episode so that
+    # hiding one also counts as a change.
+    visible = pod.get_visible_episodes_q(include_private)
+    agg = pod.get_all_episodes_raw().aggregate(
+        updated__max=Max('updated'),
+        publish__max=Max(Case(When(visible, then=F('publish')))),
+        id__count=Count(Case(When(visible, then=F('id')))))
+    last_modified = max(
+        x for x in (pod.updated, agg['updated__max'], agg['publish__max']) if x)
+
+    etag = hashlib.sha1(','.join([
+        str(pod.id),
+        variant,
+        last_modified.isoformat(),
+        str(agg['id__count']),
+    ]).encode('utf-8')).hexdigest()
+    return '"%s"' % etag, time.mktime(last_modified.timetuple()), agg['id__count']
+
+
+def _is_not_modified(req, etag, last_modified):
+    if_none_match = req.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        if if_none_match.strip() == '*':
+            return True
+        tags = (t.strip() for t in if_none_match.split(','))
+        return etag in (t[2:] if t.startswith('W/') else t for t in tags)
+
+    if_modified_since = parse_http_date_safe(req.META.get('HTTP_IF_MODIFIED_SINCE') or '')
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def render_feed(pod):
+    """Returns the main public feed for the podcast as a string."""
+    episodes = pod.get_episodes(
+        limit=pod.feed_item_limit, select_related='episodefeedbackprompt')
+    body = _render_feed(pod, episodes, page_end=_get_page_end(pod, False, None))
+    if pod.feed_item_limit:
+        body = body.replace(
+            FEED_URL_PLACEHOLDER,
+            escape('https://pinecast.com%s' % reverse('feed', podcast_slug=pod.slug)))
+    return body
+
+
+def _render_feed(pod, episodes, before=None, page_end=None):
+    return ''.join(_iter_feed(pod, episodes, FEED_URL_PLACEHOLDER, before, page_end))
+
+
+def _iter_feed(pod, episodes, feed_url, before=None, page_end=None):
+    """
+    Yields the feed document in pieces: the channel header, each item as it
+    is rendered, then the footer. Nothing holds on to the items, so memory use
+    does not grow with the size of the back catalog when `episodes` is itself
+    a lazy iterator.
+    """
+    flair = FlairContext(pod)
+
+    channel_explicit_tag = '<itunes:explicit>%s</itunes:explicit>' % ('yes' if pod.is_explicit else 'no')
 
     categories = sorted([c.category for c in pod.podcastcategory_set.all()], key=lambda c: len(c))
     category_map = {}
@@ -105,7 +286,11 @@ def _gen_feed(req, pod, episodes):
     else:
         canonical_url = 'https://pinecast.com/feed/%s' % escape(pod.slug)
 
-    content = [
+    self_url = canonical_url
+    if before is not None:
+        self_url = '%s?before=%s' % (feed_url, _format_page_key(before))
+
+    header = [
         '<?xml version="1.0" encoding="UTF-8"?>',
         '<rss xmlns:atom="http://www.w3.org/2005/Atom"',
         '     xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"',
@@ -114,7 +299,10 @@ def _gen_feed(req, pod, episodes):
         '<channel>',
         '<title>%s</title>' % escape(pod.name),
         '<link>%s</link>' % escape(pod.homepage),
-        '<atom:link href="%s" rel="self" type="application/rss+xml" />' % canonical_url,
+        '<atom:link href="%s" rel="self" type="application/rss+xml" />' % self_url,
+        ('<atom:link href=%s rel="first" />' % quoteattr(feed_url)) if pod.feed_item_limit else '',
+        ('<atom:link href=%s rel="next" />' % quoteattr(
+            '%s?before=%s' % (feed_url, _format_page_key(page_end)))) if page_end else '',
         '<language>%s</language>' % escape(pod.language),
         '<copyright>%s</copyright>' % escape(pod.copyright),
         '<generator>Pinecast (https://pinecast.com)</generator>',
@@ -134,31 +322,90 @@ def _gen_feed(req, pod, episodes):
         '<url>%s</url>' % escape(_asset(pod.cover_image)),
         '</image>',
         '\n'.join(render_cat(category_map)),
-        '\n'.join(items),
+    ]
+    yield '\n'.join(c for c in header if c)
+
+    # Rendered items are cached individually, so rebuilding a feed after one
+    # episode changes only re-renders that episode.
+    stamp = _get_item_stamp(pod, flair)
+    item_count = 0
+    episodes = iter(episodes)
+    while True:
+        batch = list(itertools.islice(episodes, FEED_ITEM_BATCH_SIZE))
+        if not batch:
+            break
+
+        cached = feed_cache.get_items(batch, stamp)
+        rendered = []
+        for ep in batch:
+            item_count += 1
+            item = cached.get(ep.id)
+            if item is None:
+                item = _render_feed_item(pod, ep, flair, channel_explicit_tag)
+                rendered.append((ep, item))
+            yield '\n' + item
+
+        if rendered:
+            feed_cache.set_items(rendered, stamp)
+
+    footer = [
         '</channel>',
         '</rss>',
     ]
-    if UserSettings.get_from_user(pod.owner).plan == plans.PLAN_DEMO:
-        if len(episodes) > 10:
-            content.append('<!-- This feed is truncated because the owner is not a paid customer. -->')
+    if flair.is_demo:
+        if item_count > 10:
+            footer.append('<!-- This feed is truncated because the owner is not a paid customer. -->')
         else:
-            content.append('<!-- This feed will be truncated at 10 items because the owner is not a paid customer. -->')
+            footer.append('<!-- This feed will be truncated at 10 items because the owner is not a paid customer. -->')
+    yield '\n' + '\n'.join(footer)
 
-    # Write the log of this to the analytics back-end(s)
-    analytics_log.write_subscription(req, pod)
 
-    resp = HttpResponse(
-        '\n'.join(c for c in content if c),
-        content_type='application/rss+xml',
-        status=200 if not pod.rss_redirect else 301)
-    if pod.rss_redirect:
-        resp.setdefault('Location', pod.rss_redirect)
+FEED_ITEM_BATCH_SIZE = 100
 
-    resp.setdefault('Cache-Control', 'public, max-age=120')
-    resp.setdefault('Access-Control-Allow-Origin', '*')
-    resp.setdefault('Access-Control-Request-Method', 'GET')
+def _get_item_stamp(pod, flair):
+    # Everything an item is rendered from that isn't on the episode itself
+    return hashlib.sha1(repr((
+        flair.is_demo,
+        flair.available_flags,
+        flair.coupon_code,
+        flair.site_url,
+        pod.name,
+        pod.slug,
+        pod.author_name,
+        pod.is_explicit,
+    )).encode('utf-8')).hexdigest()
 
-    return resp
+
+def _render_feed_item(pod, ep, flair, channel_explicit_tag):
+    ep_url = _asset(ep.get_url('rss'))
+
+    md_desc = ep.get_html_description(flair=flair)
+
+    explicit_tag = ''
+    if ep.explicit_override != PodcastEpisode.EXPLICIT_OVERRIDE_CHOICE_NONE:
+        explicit_tag = '<itunes:explicit>%s</itunes:explicit>' % (
+            'yes' if ep.explicit_override == PodcastEpisode.EXPLICIT_OVERRIDE_CHOICE_EXPLICIT else 'clean')
+    else:
+        explicit_tag = channel_explicit_tag
+
+    return '\n'.join([
+        '<item>',
+        '<title>%s</title>' % escape(ep.title),
+        '<description><![CDATA[%s]]></description>' % md_desc,
+        '<link>%s</link>' % escape(ep_url),
+        '<guid isPermaLink="false">https://pinecast.com/guid/%s</guid>' % escape(str(ep.id)),
+        '<pubDate>%s</pubDate>' % formatdate(time.mktime(ep.publish.timetuple())),
+        explicit_tag,
+        '<itunes:author>%s</itunes:author>' % escape(pod.author_name),
+        '<itunes:subtitle>%s</itunes:subtitle>' % escape(ep.subtitle),
+        '<itunes:image href=%s />' % quoteattr(_asset(ep.image_url)),
+        '<itunes:duration>%s</itunes:duration>' % escape(ep.formatted_duration()),
+        '<enclosure url=%s length=%s type=%s />' % (
+            quoteattr(ep_url), quoteattr(str(ep.audio_size)), quoteattr(ep.audio_type)),
+        ('<dc:copyright>%s</dc:copyright>' % escape(ep.copyright)) if ep.copyright else '',
+        ('<dc:rights>%s</dc:rights>' % escape(ep.license)) if ep.license else '',
+        '</item>',
+    ])
 
 
 def player(req, episode_id):
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.2 on 2017-04-16 22:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0014_site_google_play_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siteblogpost',
+            name='body_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='siteblogpost',
+            name='body_html_source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='sitepage',
+            name='body_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='sitepage',
+            name='body_html_source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+    ]
@@ -11,7 +11,7 @@ from django.utils.translation import ugettext_lazy
 from accounts.models import UserSettings
 from accounts.payment_plans import FEATURE_MIN_SITES, minimum
 from podcasts.models import Podcast
-from pinecast.helpers import cached_method
+from pinecast.helpers import cached_method, get_rendered_markdown
 
 
 GA_VALIDATOR = RegexValidator(r'^[0-9a-zA-Z\-]*$', ugettext_lazy('Only GA IDs are accepted'))
@@ -97,12 +97,22 @@ class SiteBlogPost(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     publish = models.DateTimeField()
     body = models.TextField()
+    body_html = models.TextField(default='', blank=True, editable=False)
+    body_html_source_hash = models.CharField(
+        max_length=40, default='', blank=True, editable=False)
 
     disable_comments = models.BooleanField(default=False)
 
     def __str__(self):
         return '%s on %s' % (self.slug, self.site.podcast.slug)
 
+    def save(self, *args, **kwargs):
+        self.get_html_body(persist=False)
+        super(SiteBlogPost, self).save(*args, **kwargs)
+
+    def get_html_body(self, persist=True):
+        return get_rendered_markdown(self, self.body, 'body_html', persist=persist)
+
     class Meta:
         unique_together = (('site', 'slug'), )
 
@@ -121,6 +131,17 @@ class SitePage(models.Model):
     created = models.DateTimeField(auto_now_add=True)
 
     body = models.TextField()
+    body_html = models.TextField(default='', blank=True, editable=False)
+    body_html_source_hash = models.CharField(
+        max_length=40, default='', blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.page_type == 'markdown':
+            self.get_html_body(persist=False)
+        super(SitePage, self).save(*args, **kwargs)
+
+    def get_html_body(self, persist=True):
+        return get_rendered_markdown(self, self.body, 'body_html', persist=persist)
 
     @classmethod
     def get_body_from_req(cls, req, page_type=None):
@@ -1,9 +1,10 @@
 from __future__ import absolute_import
 
 import datetime
+import hashlib
+from functools import wraps
 from math import ceil
 
-import gfm
 from django.conf import settings
 from django.contrib.syndication.views import Feed
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
@@ -13,13 +14,26 @@ from django.shortcuts import redirect, render
 from . import models
 from accounts.models import UserSettings
 from accounts.payment_plans import FEATURE_MIN_SITE_FAVICON, minimum
-from podcasts.models import Podcast, PodcastEpisode
+from podcasts.models import FlairContext, Podcast, PodcastEpisode
+from pinecast.coalesce import coalesce
 from pinecast.helpers import get_object_or_404, reverse
 
 
 SITE_EPISODES_PER_PAGE = 5
 
 
+def _coalesced(view):
+    # Bursts of requests for the same page (say, right after an episode is
+    # shared) are rendered once, with the rest waiting for that response.
+    @wraps(view)
+    def wrapper(req, podcast_slug, *args, **kwargs):
+        key = 'site:%s:%s' % (
+            podcast_slug,
+            hashlib.sha1(('%s,%s' % ('site_hostname' in req.META, req.get_full_path())).encode('utf-8')).hexdigest())
+        return coalesce(key, lambda: view(req, podcast_slug, *args, **kwargs))
+    return wrapper
+
+
 def _subdomain_reverse(*args, **kwargs):
     if 'podcast_slug' in kwargs:
         del kwargs['podcast_slug']
@@ -45,6 +59,7 @@ def _srender(req, podcast, site, template, data=None):
     return render(req, 'sites/%s/%s' % (site.theme, template), data)
 
 
+@_coalesced
 def site_home(req, podcast_slug):
     pod = get_object_or_404(Podcast, slug=podcast_slug, select_related='owner')
     site = get_object_or_404(models.Site, podcast=pod)
@@ -56,9 +71,10 @@ def site_home(req, podcast_slug):
         pager = paginator.page(1)
     except EmptyPage:
         return redirect(_subdomain_reverse('site_home', podcast_slug=pod.slug))
-    return _srender(req, pod, site, 'home.html', {'pager': pager})
+    return _srender(req, pod, site, 'home.html', {'pager': pager, 'flair': FlairContext(pod)})
 
 
+@_coalesced
 def site_blog(req, podcast_slug):
     pod = get_object_or_404(Podcast, slug=podcast_slug, select_related='owner')
     site = get_object_or_404(models.Site, podcast=pod)
@@ -73,21 +89,24 @@ def site_blog(req, podcast_slug):
         return redirect('site_home', podcast_slug=pod.slug)
     return _srender(req, pod, site, 'blog.html', {'posts': posts, 'pager': pager})
 
+@_coalesced
 def site_post(req, podcast_slug, post_slug):
     pod = get_object_or_404(Podcast, slug=podcast_slug, select_related='owner')
     site = get_object_or_404(models.Site, podcast=pod)
     post = get_object_or_404(models.SiteBlogPost, site=site, slug=post_slug)
     return _srender(req, pod, site, 'post.html', {'post': post})
 
+@_coalesced
 def site_episode(req, podcast_slug, episode_id):
     pod = get_object_or_404(Podcast, slug=podcast_slug, select_related='owner')
     site = get_object_or_404(models.Site, podcast=pod)
     episode = get_object_or_404(PodcastEpisode, podcast=site.podcast, id=episode_id)
     if episode.check_is_private():
         raise Http404()
-    return _srender(req, pod, site, 'episode.html', {'episode': episode})
+    return _srender(req, pod, site, 'episode.html', {'episode': episode, 'flair': FlairContext(pod)})
 
 
+@_coalesced
 def site_page(req, podcast_slug, page_slug):
     pod = get_object_or_404(Podcast, slug=podcast_slug, select_related='owner')
     site = get_object_or_404(models.Site, podcast=pod)
@@ -118,7 +137,7 @@ class BlogRSS(Feed):
         return item.title
 
     def item_description(self, item):
-        return gfm.markdown(item.body)
+        return item.get_html_body()
 
     def item_link(self, item):
         return _subdomain_reverse('site_post', podcast_slug=item.site.podcast.slug, post_slug=item.slug)
@@ -135,6 +154,7 @@ class BlogRSS(Feed):
         return item.site.podcast.copyright
 
 
+@_coalesced
 def sitemap(req, podcast_slug):
     pod = get_object_or_404(Podcast, slug=podcast_slug)
     site = get_object_or_404(models.Site, podcast=pod)